@@ -1,11 +1,20 @@
+import numpy as np
 import pandas as pd
 from sklearn.decomposition import PCA
-from sklearn.model_selection import train_test_split, GridSearchCV, StratifiedKFold
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import (
+    train_test_split, GridSearchCV, HalvingGridSearchCV, RandomizedSearchCV,
+    StratifiedKFold, ParameterGrid
+)
 from sklearn.metrics import (
     accuracy_score, classification_report,
     f1_score, balanced_accuracy_score, confusion_matrix
 )
 
+from profiling import profiler
+
+SEARCHES = ("grid", "halving", "random")
+
 class ExperimentRunner:
     def __init__(self, random_state: int = 42, scoring: str = "accuracy"):
         self.random_state = random_state
@@ -24,15 +33,83 @@ class ExperimentRunner:
             X, y, test_size=test_size, stratify=y, random_state=self.random_state
         )
 
-    def grid_search(self, model_spec, X_train, y_train):
-        gs = GridSearchCV(
-            model_spec.pipeline,
-            model_spec.param_grid,
-            cv=self.cv,
-            n_jobs=-1,
-            scoring=self.scoring
-        )
-        gs.fit(X_train, y_train)
+    @staticmethod
+    def _search_params(model_spec, search):
+        # The spec's search_params are written for its own strategy; an
+        # override (e.g. search="random" on a halving spec) uses defaults
+        if search == model_spec.search:
+            return dict(model_spec.search_params)
+        return {}
+
+    def _make_search(self, model_spec, search):
+        # Search object for the strategy (see ModelSpec.search)
+        params = self._search_params(model_spec, search)
+        if search == "grid":
+            return GridSearchCV(
+                model_spec.pipeline, model_spec.param_grid,
+                cv=self.cv, n_jobs=-1, scoring=self.scoring
+            )
+        if search == "halving":
+            # Budget parameter (e.g. n_estimators): its largest grid value
+            # is the budget of the last round; default budget: n_samples
+            grid = dict(model_spec.param_grid)
+            resource = params.pop("resource", "n_samples")
+            if resource != "n_samples":
+                params.setdefault("max_resources", max(grid.pop(resource)))
+            return HalvingGridSearchCV(
+                model_spec.pipeline, grid, resource=resource,
+                cv=self.cv, n_jobs=-1, scoring=self.scoring,
+                random_state=self.random_state, **params
+            )
+        if search == "random":
+            n_grid = len(ParameterGrid(model_spec.param_grid))
+            n_iter = min(params.pop("n_iter", 10), n_grid)
+            return RandomizedSearchCV(
+                model_spec.pipeline, model_spec.param_grid, n_iter=n_iter,
+                cv=self.cv, n_jobs=-1, scoring=self.scoring,
+                random_state=self.random_state, **params
+            )
+        raise ValueError(f"Unknown search '{search}'. Choose one of: {', '.join(SEARCHES)}")
+
+    def _search_cost(self, model_spec, gs, seconds):
+        # Fits done vs. the exhaustive grid, and the grid's estimated wall
+        # time: a grid fit costs as much as the fits with the last round's
+        # budget, scaled by the budget parameter's mean grid value over that
+        # budget (fit time grows linearly with n_estimators)
+        n_splits = self.cv.get_n_splits()
+        results = gs.cv_results_
+        fits = len(results["params"]) * n_splits
+        grid_fits = len(ParameterGrid(model_spec.param_grid)) * n_splits
+
+        cost = results["mean_fit_time"] + results["mean_score_time"]
+        full = np.ones(len(cost), dtype=bool)
+        scale = 1.0
+        if "n_resources" in results:
+            full = results["n_resources"] == results["n_resources"].max()
+            resource = self._search_params(model_spec, gs.search_).get("resource")
+            if resource in model_spec.param_grid:
+                values = model_spec.param_grid[resource]
+                scale = np.mean(values) / results["n_resources"].max()
+        total = cost.sum() * n_splits
+        grid_s = seconds * cost[full].mean() * scale * grid_fits / total if total > 0 else seconds
+        return {
+            "fits": fits,
+            "grid_fits": grid_fits,
+            "search_s": seconds,
+            "grid_s_est": max(grid_s, seconds),
+        }
+
+    def grid_search(self, model_spec, X_train, y_train, search=None):
+        # search overrides model_spec.search (e.g. "grid" to check winners)
+        search = search or model_spec.search
+        gs = self._make_search(model_spec, search)
+        n_candidates = len(ParameterGrid(model_spec.param_grid))
+        with profiler.stage(f"{type(gs).__name__}.fit.{model_spec.name}",
+                            rows=X_train.shape[0], cols=X_train.shape[1],
+                            candidates=n_candidates, folds=self.cv.get_n_splits()) as record:
+            gs.fit(X_train, y_train)
+        gs.search_ = search
+        gs.cost_ = self._search_cost(model_spec, gs, record["wall_s"])
         return gs
 
     def evaluate(self, estimator, X_test, y_test):
@@ -47,7 +124,7 @@ class ExperimentRunner:
             "report": classification_report(y_test, pred, zero_division=0),
         }
 
-    def run_all(self, specs, X, y):
+    def run_all(self, specs, X, y, search=None):
         X_train, X_test, y_train, y_test = self.train_test(X, y)
 
         rows = []
@@ -55,7 +132,7 @@ class ExperimentRunner:
         confusions = {}
 
         for spec in specs:
-            gs = self.grid_search(spec, X_train, y_train)
+            gs = self.grid_search(spec, X_train, y_train, search=search)
             metrics = self.evaluate(gs.best_estimator_, X_test, y_test)
 
             rows.append({
@@ -65,6 +142,11 @@ class ExperimentRunner:
                 "test_balanced_accuracy": metrics["balanced_accuracy"],
                 "test_f1_macro": metrics["f1_macro"],
                 "best_params": gs.best_params_,
+                "search": gs.search_,
+                "fits": gs.cost_["fits"],
+                "grid_fits": gs.cost_["grid_fits"],
+                "search_s": gs.cost_["search_s"],
+                "time_saved_s": gs.cost_["grid_s_est"] - gs.cost_["search_s"],
             })
             reports[spec.name] = metrics["report"]
             confusions[spec.name] = metrics["confusion"]
@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Dict, Any, List
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler
@@ -13,6 +13,11 @@ class ModelSpec:
     name: str
     pipeline: Pipeline
     param_grid: Dict[str, Any]
+    # Search strategy: "grid" (exhaustive), "halving" (successive halving
+    # on samples, or on the grid parameter named by search_params["resource"])
+    # or "random" (search_params["n_iter"] candidates of the grid)
+    search: str = "grid"
+    search_params: Dict[str, Any] = field(default_factory=dict)
 
 def get_model_specs(random_state: int = 42) -> List[ModelSpec]:
     specs = []
@@ -44,7 +49,13 @@ def get_model_specs(random_state: int = 42) -> List[ModelSpec]:
             "clf__max_depth": [None, 10],
             "clf__min_samples_leaf": [1, 2, 4],
             "clf__max_features": ["sqrt", "log2", None],
-        }
+        },
+        # 18 configs raced on growing forests (50 -> 100 -> 200 trees). The
+        # last round is exactly 200 trees, the grid winner's forest size: with
+        # a 495-tree last round (factor 3) halving picked another config
+        search="halving",
+        search_params={"resource": "clf__n_estimators", "factor": 2,
+                       "min_resources": 50, "max_resources": 200},
     ))
 
     specs.append(ModelSpec(
@@ -90,7 +101,11 @@ def get_model_specs(random_state: int = 42) -> List[ModelSpec]:
             "clf__n_estimators": [50, 100, 200],
             "clf__max_samples": [0.7, 1.0],
             "clf__max_features": [0.7, 1.0],
-        }
+        },
+        # 50 -> 100 -> 200 trees, so the last round is a grid value
+        search="halving",
+        search_params={"resource": "clf__n_estimators", "factor": 2,
+                       "min_resources": 50},
     ))
 
     specs.append(ModelSpec(
@@ -106,7 +121,10 @@ def get_model_specs(random_state: int = 42) -> List[ModelSpec]:
         param_grid={
             "clf__n_estimators": [50, 100, 200],
             "clf__learning_rate": [0.1, 0.5, 1.0],
-        }
+        },
+        # 6 of the 9 configs; with 5 the grid winner is not sampled
+        search="random",
+        search_params={"n_iter": 6},
     ))
 
     return specs
@@ -0,0 +1,145 @@
+import json
+import os
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+_PROC = Path("/proc")
+
+
+def _vm_hwm_mb(pid="self"):
+    # VmHWM (peak RSS) of a process on Linux, None elsewhere or if gone
+    try:
+        with open(_PROC / str(pid) / "status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _peak_rss_mb():
+    # Peak resident set size (VmHWM on Linux, ru_maxrss elsewhere)
+    peak = _vm_hwm_mb()
+    if peak is None and resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    return peak
+
+
+def _reset_peak_rss(pid="self"):
+    # Linux only: restart VmHWM from the current RSS
+    try:
+        with open(_PROC / str(pid) / "clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _children():
+    # Live child processes, e.g. the loky workers of n_jobs=-1 searches
+    pids = []
+    for task in _PROC.glob("self/task/*/children"):
+        try:
+            pids += task.read_text().split()
+        except OSError:
+            pass
+    return pids
+
+
+def _cpu_s(pid):
+    # utime + stime of a process (/proc/<pid>/stat fields 14 and 15)
+    try:
+        fields = (_PROC / pid / "stat").read_text().rsplit(")", 1)[1].split()
+    except OSError:
+        return 0.0
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def _reaped_children_cpu_s():
+    # CPU time of children that have exited and been waited for
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class StageProfiler:
+    """
+    Wall time, CPU time and peak RSS of each (non-nested) stage, e.g.
+    every search fit, saved as a JSON or CSV report.
+
+    The searches run in joblib worker processes (n_jobs=-1), which stay
+    alive between fits, so each record also has the workers' CPU time
+    and the sum of their peak RSS. On Linux they are read from /proc for
+    the live child processes, plus RUSAGE_CHILDREN for children that
+    exited; elsewhere only RUSAGE_CHILDREN is available (CPU time of
+    exited children, no memory). The "workers" column says which.
+
+    This project is run on its own (python run.py from this folder), so
+    it keeps this small profiler instead of importing the first
+    classwork's src/profiling.py.
+    """
+
+    def __init__(self, max_records=1000):
+        self.records = deque(maxlen=max_records)
+
+    @contextmanager
+    def stage(self, name, **sizes):
+        record = {"stage": name, "sizes": sizes}
+        live = _PROC.joinpath("self", "task").exists()
+        _reset_peak_rss()
+        workers = {pid: _cpu_s(pid) for pid in _children()}
+        for pid in workers:
+            _reset_peak_rss(pid)
+        reaped = _reaped_children_cpu_s()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record["wall_s"] = time.perf_counter() - wall
+            record["cpu_s"] = time.process_time() - cpu
+            peak = _peak_rss_mb()
+            record["peak_rss_mb"] = round(peak, 1) if peak is not None else None
+
+            children = _children()
+            workers_cpu = _reaped_children_cpu_s() - reaped + sum(
+                _cpu_s(pid) - workers.get(pid, 0.0) for pid in children
+            )
+            peaks = [p for p in map(_vm_hwm_mb, children) if p is not None]
+            record["workers_cpu_s"] = round(workers_cpu, 3)
+            record["workers_peak_rss_mb"] = round(sum(peaks), 1) if live else None
+            record["workers"] = "proc + rusage" if live else "rusage (cpu only)"
+            self.records.append(record)
+
+    def report(self):
+        columns = ["stage", "wall_s", "cpu_s", "workers_cpu_s", "peak_rss_mb",
+                   "workers_peak_rss_mb", "workers", "sizes"]
+        return pd.DataFrame(list(self.records), columns=columns)
+
+    def save(self, path):
+        # JSON (full records) or CSV (sizes as JSON text), by file suffix
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix == ".csv":
+            report = self.report()
+            report["sizes"] = report["sizes"].map(lambda s: json.dumps(s, default=str))
+            report.to_csv(path, index=False)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"records": list(self.records)}, f, indent=2, default=str)
+        return path
+
+
+# Process-wide profiler used by experiments.py
+profiler = StageProfiler()
@@ -4,6 +4,7 @@ import matplotlib.pyplot as plt
 from data import load_dataset
 from models import get_model_specs
 from experiments import ExperimentRunner
+from profiling import profiler
 
 def main():
     base_dir = Path(__file__).resolve().parent
@@ -41,6 +42,8 @@ def main():
 
     print("\n=== Summary ===")
     print(table.to_string(index=False))
+    print(f"Search fits: {table['fits'].sum()} of {table['grid_fits'].sum()} "
+          f"(exhaustive grid), estimated time saved: {table['time_saved_s'].sum():.1f}s")
 
     # Save outputs
     table.to_csv(docs_dir / "results.csv", index=False)
@@ -49,5 +52,9 @@ def main():
         for name in table["model"].tolist():  # order reports by the final ranking table
             f.write(f"## {name}\n{reports[name]}\n\n")
 
+    # Wall/CPU time, peak RSS and input sizes of every grid search
+    profiler.save(docs_dir / "profile_report.json")
+    profiler.save(docs_dir / "profile_report.csv")
+
 if __name__ == "__main__":
     main()
@@ -1,6 +1,104 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from time import perf_counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np # type: ignore
 import pandas as pd # type: ignore
+import scipy.sparse as sp # type: ignore
 from mlxtend.frequent_patterns import apriori, fpgrowth, association_rules # type: ignore
 
+from bitset_miner import eclat, pack_basket, count_itemsets, min_support_count
+from rule_generation import iter_rules, top_k_rules, RULE_METRICS
+from profiling import profiler, describe
+from strata import month_range, time_slot, VALID_SLOTS
+from support_sampling import (
+    ItemsetCounter, ReceiptReservoir, SamplingReport, negative_border,
+    sample_size_for, epsilon_for,
+)
+from config import ( # type: ignore
+    MERCH_LEVELS, DATE_COL, TIME_COL, MINUTE_COL, MONTH_COL, DAY_COL,
+)
+
+
+def _is_sparse(basket: pd.DataFrame) -> bool:
+    return basket.shape[1] > 0 and all(
+        isinstance(dt, pd.SparseDtype) for dt in basket.dtypes
+    )
+
+
+def _sparse_basket(
+    receipt_codes: np.ndarray,
+    item_codes: np.ndarray,
+    receipts: pd.Index,
+    items: pd.Index,
+    min_support: float | None = None,
+) -> pd.DataFrame:
+    """
+    Sparse bool receipt x item DataFrame from integer code arrays, with
+    one entry per distinct (receipt, item). Items below min_support are
+    dropped on the code arrays, before the matrix is built.
+    """
+    n_items = len(items)
+    n_transactions = len(receipts)
+
+    # One entry per distinct (receipt, item)
+    keys = np.unique(receipt_codes.astype(np.int64) * n_items + item_codes)
+    rows = keys // n_items
+    cols = keys % n_items
+
+    # Singleton support pruning on the code arrays (Apriori principle)
+    keep = np.ones(n_items, dtype=bool)
+    if min_support is not None:
+        item_counts = np.bincount(cols, minlength=n_items)
+        keep = item_counts >= min_support * n_transactions
+        mask = keep[cols]
+        rows, cols = rows[mask], cols[mask]
+
+    # Renumber the surviving items to 0..n_kept-1
+    new_code = np.cumsum(keep) - 1
+    mat = sp.csr_matrix(
+        (np.ones(len(rows), dtype=bool), (rows, new_code[cols])),
+        shape=(n_transactions, int(keep.sum())),
+    )
+    return pd.DataFrame.sparse.from_spmatrix(
+        mat, index=receipts, columns=items[keep]
+    )
+
+
+def _mine_partition(args) -> List[Tuple[int, ...]]:
+    # SON phase 1 worker: locally frequent itemsets of one shard, as
+    # tuples of column positions (shard columns are named 0..n-1)
+    algorithm, shard, min_support = args
+    if shard.shape[0] == 0:
+        return []
+    freq_items = AssociationRuleMiner.ALGORITHMS[algorithm](
+        shard, min_support=min_support, use_colnames=True
+    )
+    return [tuple(sorted(s)) for s in freq_items["itemsets"]]
+
+
+def _mine_stratum(args) -> pd.DataFrame:
+    # Worker for run_stratified: rules of one stratum, given the
+    # (receipt code, item code) pairs of its receipts
+    (algorithm, rows, cols, items, min_support,
+     metric, min_threshold, top_k, min_confidence) = args
+
+    receipts, receipt_codes = np.unique(rows, return_inverse=True)
+    miner = AssociationRuleMiner(pd.DataFrame(), sparse=True)
+    miner.n_transactions = len(receipts)
+
+    basket = _sparse_basket(receipt_codes, cols, pd.RangeIndex(len(receipts)),
+                            items, min_support=min_support)
+    if basket.shape[1] == 0:
+        return pd.DataFrame()
+
+    freq_items = miner._find_frequent_itemsets(
+        AssociationRuleMiner.ALGORITHMS[algorithm], basket, min_support
+    )
+    return miner._rules_from_itemsets(freq_items, metric, min_threshold,
+                                      top_k, min_confidence)
+
 
 class AssociationRuleMiner:
     """
@@ -8,19 +106,91 @@ class AssociationRuleMiner:
 
     - Transaction: one receipt (scontrino_id)
     - Item: merchandising category at level liv4 (or another column)
+
+    With sparse=True the basket is built as a sparse boolean matrix
+    straight from integer codes (see _build_sparse_transaction_matrix),
+    which lets mlxtend mine all receipts instead of a sample.
+
+    Frequent itemsets come from one of the ALGORITHMS backends, selected
+    by name in run(): mlxtend's apriori/fpgrowth, or the built-in
+    bitset Eclat (bitset_miner.eclat) for low supports.
+
+    Baskets are memoized per (level_col, min_support, sparse), so running
+    several algorithms on the same data builds the matrix only once;
+    compare_algorithms() uses this to benchmark the backends.
+
+    run_partitioned() mines receipt shards in a process pool and counts
+    the union of local candidates once on all receipts (SON algorithm),
+    which gives exactly the same itemsets as a single-process run.
+
+    run_multilevel() mines every level of the liv1 -> liv4 taxonomy from
+    a single receipt encoding (ML_T2-style top-down filtering).
+
+    run_stratified() mines every month range (R1/R2/R3) and time slot
+    (S1/S2/S3) from one shared receipt encoding, one stratum per worker.
+
+    run_sampled() mines a uniform receipt sample at a support lowered by
+    the Hoeffding error bound and verifies the candidates and their
+    negative border on all receipts (Toivonen), so the sample size
+    follows from epsilon / delta and the supports are exact.
+
+    All run_* methods accept top_k / min_confidence: rules are then
+    streamed by rule_generation.iter_rules (confidence pruning) and only
+    the k best by metric are kept, instead of materializing every rule
+    with mlxtend's association_rules.
     """
 
+    ALGORITHMS = {
+        "apriori": apriori,
+        "fpgrowth": fpgrowth,
+        "eclat": eclat,
+    }
+
     def __init__(
         self,
         df: pd.DataFrame,
         level_col: str = "liv4",
         id_col: str = "scontrino_id",
+        sparse: bool = False,
     ):
-        self.df = df.copy()
+        # The miner never modifies df, so no defensive copy is needed
+        self.df = df
         self.level_col = level_col
         self.id_col = id_col
+        self.sparse = sparse
         self.n_transactions: int = 0
+        self._baskets: Dict[tuple, Tuple[pd.DataFrame, int]] = {}
+        self._samples: Dict[tuple, Tuple["AssociationRuleMiner", bool]] = {}
+        self._counters: Dict[str, ItemsetCounter] = {}
+        self.sampling_: SamplingReport | None = None  # set by sampled mining
+
+    def clear_cache(self) -> None:
+        # Drop memoized baskets and samples (e.g. after replacing self.df)
+        self._baskets.clear()
+        self._samples.clear()
+        self._counters.clear()
+
+    def _get_basket(self, min_support: float) -> pd.DataFrame:
+        # Memoized _build_transaction_matrix(min_support_singleton=min_support)
+        key = (self.level_col, min_support, self.sparse)
+        if key not in self._baskets:
+            basket = self._build_transaction_matrix(
+                min_support_singleton=min_support
+            )
+            self._baskets[key] = (basket, self.n_transactions)
+        basket, self.n_transactions = self._baskets[key]
+        return basket
+
+    def _check_columns(self) -> None:
+        if self.id_col not in self.df.columns:
+            raise ValueError(f"Missing receipt column: {self.id_col}")
+        if self.level_col not in self.df.columns:
+            raise ValueError(
+                f"Missing merchandising level column: {self.level_col}"
+            )
 
+    @profiler("AssociationRuleMiner._build_transaction_matrix",
+              sizes=lambda self, *args, **kwargs: describe(self.df))
     def _build_transaction_matrix(
         self,
         min_support_singleton: float | None = None,
@@ -30,17 +200,15 @@ class AssociationRuleMiner:
         Optionally drop items whose *individual* support
         is below min_support_singleton.
         """
-        if self.id_col not in self.df.columns:
-            raise ValueError(f"Missing receipt column: {self.id_col}")
-        if self.level_col not in self.df.columns:
-            raise ValueError(
-                f"Missing merchandising level column: {self.level_col}"
-            )
+        if self.sparse:
+            return self._build_sparse_transaction_matrix(min_support_singleton)
+
+        self._check_columns()
 
         # Count occurrences per (transaction, item)
         basket = (
             self.df
-            .groupby([self.id_col, self.level_col])
+            .groupby([self.id_col, self.level_col], observed=True)
             .size()
             .unstack()
             .fillna(0)
@@ -63,6 +231,43 @@ class AssociationRuleMiner:
 
         return basket
 
+    def _build_sparse_transaction_matrix(
+        self,
+        min_support_singleton: float | None = None,
+    ) -> pd.DataFrame:
+        """
+        Same basket as _build_transaction_matrix, but as a sparse bool
+        DataFrame built from integer codes, with singleton pruning done
+        before any matrix is materialized.
+        """
+        self._check_columns()
+
+        pairs = self.df[[self.id_col, self.level_col]].dropna()
+        receipt_codes, receipts = pd.factorize(pairs[self.id_col])
+        item_codes, items = pd.factorize(pairs[self.level_col], sort=True)
+
+        self.n_transactions = len(receipts)
+        return _sparse_basket(receipt_codes, item_codes, receipts, items,
+                              min_support=min_support_singleton)
+
+    def _find_frequent_itemsets(self, algorithm, basket: pd.DataFrame,
+                                min_support: float) -> pd.DataFrame:
+        # mlxtend's sparse path only accepts positional (0..n-1) integer
+        # column names: mine on positions, then map back to item labels
+        sizes = {**describe(basket), "min_support": min_support}
+        if not _is_sparse(basket):
+            with profiler.stage(f"frequent_itemsets.{algorithm.__name__}", **sizes):
+                return algorithm(basket, min_support=min_support, use_colnames=True)
+
+        labels = basket.columns
+        basket = basket.set_axis(range(basket.shape[1]), axis=1)
+        with profiler.stage(f"frequent_itemsets.{algorithm.__name__}", **sizes):
+            freq_items = algorithm(basket, min_support=min_support, use_colnames=True)
+        freq_items["itemsets"] = freq_items["itemsets"].map(
+            lambda s: frozenset(labels[i] for i in s)
+        )
+        return freq_items
+
     def _postprocess_rules(self, rules: pd.DataFrame) -> pd.DataFrame:
 
         # Add absolute support/coverage and sort by lift
@@ -76,63 +281,569 @@ class AssociationRuleMiner:
         rules = rules.sort_values("lift", ascending=False)
         return rules
 
-    def run_apriori(
-        self,
-        min_support: float = 0.01,
-        metric: str = "lift",
-        min_threshold: float = 1.0,
-    ) -> pd.DataFrame:
-        
-        # Run Apriori on the basket matrix and generate association rules
-        basket = self._build_transaction_matrix(
-            min_support_singleton=min_support
-        )
+    def _mine_itemsets(self, algorithm: str, min_support: float) -> pd.DataFrame:
+        # Frequent itemsets from the named backend on the memoized basket
+        if algorithm not in self.ALGORITHMS:
+            raise ValueError(
+                f"Unknown algorithm '{algorithm}'. "
+                f"Choose one of: {', '.join(self.ALGORITHMS)}"
+            )
+
+        basket = self._get_basket(min_support)
 
         if basket.shape[1] == 0:
             # No items with support >= min_support
             return pd.DataFrame()
 
-        freq_items = apriori(
-            basket,
-            min_support=min_support,
-            use_colnames=True,
+        return self._find_frequent_itemsets(
+            self.ALGORITHMS[algorithm], basket, min_support
         )
+
+    def _rules_from_itemsets(
+        self,
+        freq_items: pd.DataFrame,
+        metric: str = "lift",
+        min_threshold: float = 1.0,
+        top_k: int | None = None,
+        min_confidence: float = 0.0,
+    ) -> pd.DataFrame:
         if freq_items.empty:
             return pd.DataFrame()
 
-        rules = association_rules(
-            freq_items,
-            metric=metric,
-            min_threshold=min_threshold,
-        )
+        with profiler.stage("association_rules", itemsets=len(freq_items)) as record:
+            if top_k is not None:
+                rules = top_k_rules(freq_items, top_k, metric, min_threshold,
+                                    min_confidence)
+            elif min_confidence > 0:
+                rules = pd.DataFrame(
+                    list(iter_rules(freq_items, min_confidence, metric, min_threshold)),
+                    columns=["antecedents", "consequents"] + RULE_METRICS,
+                )
+            else:
+                rules = association_rules(
+                    freq_items,
+                    metric=metric,
+                    min_threshold=min_threshold,
+                )
+            record["sizes"]["rules"] = len(rules)
         return self._postprocess_rules(rules)
 
-    def run_fpgrowth(
+    def run(
         self,
+        algorithm: str = "apriori",
         min_support: float = 0.01,
         metric: str = "lift",
         min_threshold: float = 1.0,
+        top_k: int | None = None,
+        min_confidence: float = 0.0,
     ) -> pd.DataFrame:
-        
-        # Run FP-Growth on the basket matrix and generate association rules
-        basket = self._build_transaction_matrix(
-            min_support_singleton=min_support
-        )
+        # Mine frequent itemsets with the named backend and generate rules
+        freq_items = self._mine_itemsets(algorithm, min_support)
+        return self._rules_from_itemsets(freq_items, metric, min_threshold,
+                                         top_k, min_confidence)
+
+    def compare_algorithms(
+        self,
+        algorithms: Sequence[str] = ("apriori", "fpgrowth"),
+        min_support: float = 0.01,
+        metric: str = "lift",
+        min_threshold: float = 1.0,
+        epsilon: float | None = None,
+        delta: float = 0.05,
+    ) -> Tuple[pd.DataFrame, Dict[str, pd.DataFrame]]:
+        """
+        Run several backends on one shared basket.
+
+        Returns a summary (one row per algorithm with timings, counts and
+        whether its itemsets match the first algorithm's) and the rules
+        of each algorithm. With epsilon set, each backend mines a sample
+        as in run_sampled() and the summary adds the sample size; the
+        sample and the verification encoding are built once (basket_s)
+        and shared by all backends.
+        """
+        t0 = perf_counter()
+        if epsilon is None:
+            self._get_basket(min_support)
+        else:
+            self._prepare_sampled(min_support, epsilon, delta)
+        basket_s = perf_counter() - t0
+
+        rows = []
+        rules: Dict[str, pd.DataFrame] = {}
+        reference = None
+        for algorithm in algorithms:
+            t0 = perf_counter()
+            if epsilon is None:
+                freq_items = self._mine_itemsets(algorithm, min_support)
+            else:
+                freq_items = self._mine_itemsets_sampled(algorithm, min_support,
+                                                         epsilon, delta)
+            t1 = perf_counter()
+            rules[algorithm] = self._rules_from_itemsets(
+                freq_items, metric, min_threshold
+            )
+            t2 = perf_counter()
 
+            supports = (
+                dict(zip(freq_items["itemsets"], freq_items["support"]))
+                if not freq_items.empty else {}
+            )
+            if reference is None:
+                reference = supports
+            match = supports.keys() == reference.keys() and all(
+                np.isclose(supports[k], reference[k]) for k in supports
+            )
+
+            rows.append({
+                "algorithm": algorithm,
+                "min_support": min_support,
+                "n_transactions": self.n_transactions,
+                "n_itemsets": len(supports),
+                "n_rules": len(rules[algorithm]),
+                "basket_s": basket_s,
+                "mining_s": t1 - t0,
+                "rules_s": t2 - t1,
+                "itemsets_match": match,
+            })
+            if epsilon is not None:
+                rows[-1].update(sample_size=self.sampling_.sample_size,
+                                sampled=self.sampling_.sampled,
+                                exact=self.sampling_.exact)
+
+        return pd.DataFrame(rows), rules
+
+    def _mine_itemsets_partitioned(
+        self,
+        algorithm: str,
+        min_support: float,
+        n_partitions: int,
+        n_jobs: int,
+    ) -> pd.DataFrame:
+        # SON: local mining per shard, then one exact global counting pass
+        if algorithm not in self.ALGORITHMS:
+            raise ValueError(
+                f"Unknown algorithm '{algorithm}'. "
+                f"Choose one of: {', '.join(self.ALGORITHMS)}"
+            )
+
+        basket = self._get_basket(min_support)
         if basket.shape[1] == 0:
             return pd.DataFrame()
 
-        freq_items = fpgrowth(
-            basket,
-            min_support=min_support,
-            use_colnames=True,
-        )
-        if freq_items.empty:
+        labels = basket.columns
+        positional = basket.set_axis(range(basket.shape[1]), axis=1)
+
+        # Phase 1: an itemset frequent overall is frequent (at the same
+        # relative threshold) in at least one shard
+        bounds = np.linspace(0, basket.shape[0], n_partitions + 1).astype(int)
+        shards = [
+            (algorithm, positional.iloc[start:stop], min_support)
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+        if n_jobs > 1 and len(shards) > 1:
+            with ProcessPoolExecutor(max_workers=min(n_jobs, len(shards))) as pool:
+                local = list(pool.map(_mine_partition, shards))
+        else:
+            local = [_mine_partition(shard) for shard in shards]
+
+        candidates = sorted(set().union(*local))
+        if not candidates:
             return pd.DataFrame()
 
-        rules = association_rules(
-            freq_items,
-            metric=metric,
-            min_threshold=min_threshold,
+        # Phase 2: exact supports of all candidates on the full basket
+        counts = count_itemsets(pack_basket(positional), candidates)
+        support = counts / self.n_transactions
+        keep = support >= min_support
+
+        return pd.DataFrame({
+            "support": support[keep],
+            "itemsets": [
+                frozenset(labels[i] for i in c)
+                for c, k in zip(candidates, keep) if k
+            ],
+        })
+
+    def run_partitioned(
+        self,
+        algorithm: str = "fpgrowth",
+        min_support: float = 0.01,
+        metric: str = "lift",
+        min_threshold: float = 1.0,
+        n_partitions: Optional[int] = None,
+        n_jobs: Optional[int] = None,
+        top_k: int | None = None,
+        min_confidence: float = 0.0,
+    ) -> pd.DataFrame:
+        # Partitioned (SON) mining over all cores, exact supports
+        n_jobs = n_jobs or os.cpu_count() or 1
+        n_partitions = n_partitions or n_jobs
+        freq_items = self._mine_itemsets_partitioned(
+            algorithm, min_support, n_partitions, n_jobs
         )
-        return self._postprocess_rules(rules)
+        return self._rules_from_itemsets(freq_items, metric, min_threshold,
+                                         top_k, min_confidence)
+
+    def run_multilevel(
+        self,
+        algorithm: str = "apriori",
+        min_support: float | Dict[str, float] = 0.01,
+        levels: List[str] | None = None,
+        metric: str = "lift",
+        min_threshold: float = 1.0,
+        top_k: int | None = None,
+        min_confidence: float = 0.0,
+    ) -> pd.DataFrame:
+        """
+        Rules for every merchandising level in one call, tagged with a
+        "level" column.
+
+        Receipts are encoded once at the finest level (levels[-1]); each
+        coarser level is obtained by remapping the item codes through the
+        taxonomy. Levels are mined top-down and, as in ML_T2, an item is
+        only kept if its parent is frequent at the level above, which
+        matters when finer levels use a lower min_support (pass a dict
+        level -> min_support).
+        """
+        if algorithm not in self.ALGORITHMS:
+            raise ValueError(
+                f"Unknown algorithm '{algorithm}'. "
+                f"Choose one of: {', '.join(self.ALGORITHMS)}"
+            )
+        levels = levels or MERCH_LEVELS
+        missing = [c for c in [self.id_col] + levels if c not in self.df.columns]
+        if missing:
+            raise ValueError(f"Missing columns: {missing}")
+        if not isinstance(min_support, dict):
+            min_support = {level: min_support for level in levels}
+
+        # Encode receipts x finest-level items once
+        pairs = self.df[[self.id_col] + levels].dropna(subset=[self.id_col, levels[-1]])
+        receipt_codes, receipts = pd.factorize(pairs[self.id_col])
+        leaf_codes, leaves = pd.factorize(pairs[levels[-1]], sort=True)
+        n_leaves = len(leaves)
+
+        keys = np.unique(receipt_codes.astype(np.int64) * n_leaves + leaf_codes)
+        rows = keys // n_leaves
+        leaf_cols = keys % n_leaves
+        self.n_transactions = len(receipts)
+
+        # Taxonomy: leaf code -> item code at each level
+        taxonomy = {}
+        for level in levels:
+            codes, labels = pd.factorize(pairs[level], sort=True)
+            mapping = np.full(n_leaves, -1, dtype=np.int64)
+            mapping[leaf_codes] = codes
+            taxonomy[level] = (mapping, labels)
+
+        tables = []
+        allowed = np.ones(n_leaves, dtype=bool)  # leaves with frequent ancestors
+        for level in levels:
+            mapping, labels = taxonomy[level]
+            mask = allowed[leaf_cols] & (mapping[leaf_cols] >= 0)
+
+            # Cheap roll-up: remap leaf codes to this level's codes
+            basket = _sparse_basket(rows[mask], mapping[leaf_cols[mask]],
+                                    receipts, labels,
+                                    min_support=min_support[level])
+
+            # Children of infrequent items are dropped at the next level
+            frequent = np.zeros(len(labels), dtype=bool)
+            frequent[labels.get_indexer(basket.columns)] = True
+            allowed &= (mapping >= 0) & frequent[np.maximum(mapping, 0)]
+
+            if basket.shape[1] == 0:
+                continue
+            freq_items = self._find_frequent_itemsets(
+                self.ALGORITHMS[algorithm], basket, min_support[level]
+            )
+            rules = self._rules_from_itemsets(freq_items, metric, min_threshold,
+                                              top_k, min_confidence)
+            if not rules.empty:
+                rules.insert(0, "level", level)
+                tables.append(rules)
+
+        if not tables:
+            return pd.DataFrame()
+        return pd.concat(tables, ignore_index=True)
+
+    def _sample(self, sample_size: int, random_state: int) -> Tuple["AssociationRuleMiner", bool]:
+        # Reservoir sample of whole receipts, streamed over row chunks of
+        # the frame, and whether it holds every receipt (memoized)
+        key = (self.level_col, sample_size, random_state)
+        if key not in self._samples:
+            pairs = self.df[[self.id_col, self.level_col]]
+            with profiler.stage("sampling.reservoir", **describe(pairs),
+                                sample_size=sample_size):
+                reservoir = ReceiptReservoir(sample_size, id_col=self.id_col, seed=random_state)
+                for start in range(0, len(pairs), 500_000):
+                    reservoir.add(pairs.iloc[start:start + 500_000])
+            sampler = AssociationRuleMiner(reservoir.sample(), level_col=self.level_col,
+                                           id_col=self.id_col, sparse=True)
+            self._samples[key] = (sampler, reservoir.complete)
+        return self._samples[key]
+
+    def _counter(self) -> ItemsetCounter:
+        # Verification pass: all receipts encoded once (memoized)
+        if self.level_col not in self._counters:
+            with profiler.stage("sampling.encode", **describe(self.df)):
+                self._counters[self.level_col] = ItemsetCounter(
+                    self.df[self.id_col], self.df[self.level_col]
+                )
+        return self._counters[self.level_col]
+
+    def _prepare_sampled(self, min_support: float, epsilon: float, delta: float,
+                         random_state: int = 42) -> None:
+        # Inputs shared by the sampled runs of several algorithms: the
+        # sample, and the verification encoding (or the basket, when the
+        # sample holds every receipt)
+        _, complete = self._sample(sample_size_for(epsilon, delta), random_state)
+        if complete or min_support - epsilon <= 0:
+            self._get_basket(min_support)
+        else:
+            self._counter()
+
+    def _mine_itemsets_sampled(
+        self,
+        algorithm: str,
+        min_support: float,
+        epsilon: float = 0.01,
+        delta: float = 0.05,
+        sample_size: Optional[int] = None,
+        fallback: bool = True,
+        random_state: int = 42,
+    ) -> pd.DataFrame:
+        # Toivonen: mine a sample at a lowered support, then count the
+        # candidates and their negative border once on all receipts. The
+        # sample is drawn first; the full data is only encoded for the
+        # counting pass, whose tidsets cover just the candidate items
+        if algorithm not in self.ALGORITHMS:
+            raise ValueError(
+                f"Unknown algorithm '{algorithm}'. "
+                f"Choose one of: {', '.join(self.ALGORITHMS)}"
+            )
+        self._check_columns()
+        if sample_size is None:
+            sample_size = sample_size_for(epsilon, delta)
+        else:
+            epsilon = epsilon_for(sample_size, delta)
+        lowered = min_support - epsilon
+
+        sampler, complete = self._sample(sample_size, random_state)
+        if complete or lowered <= 0:
+            # The sample holds every receipt (or the lowered support is
+            # void): mine all receipts exactly
+            freq_items = self._mine_itemsets(algorithm, min_support)
+            self.sampling_ = SamplingReport(self.n_transactions, self.n_transactions,
+                                            0.0, delta, min_support, sampled=False)
+            return freq_items
+
+        sample_items = sampler._mine_itemsets(algorithm, lowered)
+        candidates = set(sample_items["itemsets"]) if not sample_items.empty else set()
+
+        counter = self._counter()
+        n_transactions = self.n_transactions = counter.n_transactions
+        report = SamplingReport(n_transactions, sampler.n_transactions, epsilon, delta, lowered)
+        self.sampling_ = report
+
+        # Items below min_support on all receipts make every itemset that
+        # contains them infrequent: those need no counting
+        min_count = min_support_count(min_support, n_transactions)
+        frequent_items = counter.frequent_items(min_count)
+        border = negative_border(candidates, frequent_items | set().union(*candidates))
+        to_count = [s for s in candidates | border if s <= frequent_items]
+        with profiler.stage("sampling.verify", itemsets=len(to_count)):
+            counted = counter.counts(to_count)
+
+        report.n_candidates, report.n_border = len(candidates), len(border)
+        report.border_frequent = sum(counted.get(s, 0) >= min_count for s in border)
+        if report.border_frequent:
+            # A frequent itemset may have been missed by the sample
+            if fallback:
+                report.fallback = True
+                return self._mine_itemsets(algorithm, min_support)
+            report.exact = False
+
+        frequent = sorted((s for s in candidates if counted.get(s, 0) >= min_count), key=len)
+        if not frequent:
+            return pd.DataFrame()
+        return pd.DataFrame({
+            "support": [counted[s] / n_transactions for s in frequent],
+            "itemsets": frequent,
+        })
+
+    def run_sampled(
+        self,
+        algorithm: str = "fpgrowth",
+        min_support: float = 0.01,
+        metric: str = "lift",
+        min_threshold: float = 1.0,
+        epsilon: float = 0.01,
+        delta: float = 0.05,
+        sample_size: Optional[int] = None,
+        fallback: bool = True,
+        random_state: int = 42,
+        top_k: int | None = None,
+        min_confidence: float = 0.0,
+    ) -> pd.DataFrame:
+        """
+        Rules from a receipt sample with a bounded error, instead of a
+        fixed-size sample.
+
+        The sample size is the Hoeffding bound for epsilon / delta (or
+        epsilon follows from an explicit sample_size). The sample is
+        drawn in one streaming pass (ReceiptReservoir) and mined at
+        min_support - epsilon, so a frequent itemset is missed with
+        probability at most delta. Candidates and their negative border
+        are then counted on all receipts: supports are exact, and if a
+        border itemset is frequent (a possible miss) the full data is
+        mined instead (fallback=True) or self.sampling_.exact is False.
+        self.sampling_ reports sample size, candidates and outcome.
+        """
+        freq_items = self._mine_itemsets_sampled(algorithm, min_support, epsilon, delta,
+                                                 sample_size, fallback, random_state)
+        return self._rules_from_itemsets(freq_items, metric, min_threshold,
+                                         top_k, min_confidence)
+
+    def _row_strata(self, dimension: str) -> pd.Series:
+        # Stratum label of every row (NaN rows belong to no stratum)
+        df = self.df
+        if dimension == "month_range":
+            month = df[MONTH_COL] if MONTH_COL in df.columns else df[DATE_COL].dt.month
+            day = df[DAY_COL] if DAY_COL in df.columns else df[DATE_COL].dt.day
+            return pd.Series(month_range(month, day), index=df.index)
+        if dimension == "time_slot":
+            minute = (df[MINUTE_COL] if MINUTE_COL in df.columns
+                      else df[TIME_COL] // pd.Timedelta(minutes=1))
+            slots = time_slot(minute)
+            # Only S1/S2/S3 are strata, as in the merchandising analysis
+            return slots.where(slots.isin(VALID_SLOTS))
+        if dimension in df.columns:
+            return df[dimension]
+        raise ValueError(f"Unknown stratum dimension: {dimension}")
+
+    def run_stratified(
+        self,
+        strata: Sequence[str] = ("month_range", "time_slot"),
+        algorithm: str = "eclat",
+        min_support: float = 0.01,
+        metric: str = "lift",
+        min_threshold: float = 1.0,
+        top_k: int | None = None,
+        min_confidence: float = 0.0,
+        n_jobs: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """
+        Rules for every stratum of the given dimensions, in one table
+        tagged with stratum_dimension / stratum.
+
+        Receipts are encoded once into (receipt, item) code arrays. For
+        each dimension the pairs are grouped by the stratum of their
+        receipt, so every stratum is a contiguous slice of the same
+        arrays. Strata are mined in a process pool with at most n_jobs
+        slices in flight, so memory does not grow with the number of
+        strata. Besides month_range and time_slot, any column of the
+        frame (e.g. a store id) can be used as a dimension.
+        """
+        if algorithm not in self.ALGORITHMS:
+            raise ValueError(
+                f"Unknown algorithm '{algorithm}'. "
+                f"Choose one of: {', '.join(self.ALGORITHMS)}"
+            )
+        self._check_columns()
+        n_jobs = n_jobs or os.cpu_count() or 1
+
+        # Shared encoding: one entry per distinct (receipt, item)
+        mask = (self.df[self.id_col].notna() & self.df[self.level_col].notna()).to_numpy()
+        receipt_codes, _ = pd.factorize(self.df[self.id_col][mask])
+        item_codes, items = pd.factorize(self.df[self.level_col][mask], sort=True)
+        n_items = len(items)
+        keys = np.unique(receipt_codes.astype(np.int64) * n_items + item_codes)
+        rows = keys // n_items
+        cols = (keys % n_items).astype(np.int32)
+        del keys
+
+        # Receipt -> row of its first line (for the stratum lookup)
+        _, first_line = np.unique(receipt_codes, return_index=True)
+
+        jobs = []
+        for dimension in strata:
+            labels = self._row_strata(dimension)[mask]
+            stratum_codes, names = pd.factorize(labels.iloc[first_line], sort=True)
+
+            # Group pairs by stratum; receipts stay sorted inside a stratum
+            pair_stratum = stratum_codes[rows]
+            order = np.argsort(pair_stratum, kind="stable")
+            dim_rows, dim_cols = rows[order], cols[order]
+            bounds = np.searchsorted(pair_stratum[order], np.arange(len(names) + 1))
+
+            for k, name in enumerate(names):
+                start, stop = bounds[k], bounds[k + 1]
+                jobs.append(((dimension, name), (
+                    algorithm, dim_rows[start:stop], dim_cols[start:stop], items,
+                    min_support, metric, min_threshold, top_k, min_confidence,
+                )))
+
+        results = {}
+        if n_jobs > 1 and len(jobs) > 1:
+            # Bounded submission: at most n_jobs strata are pickled at once
+            with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                pending = {}
+                for tag, args in jobs:
+                    if len(pending) >= n_jobs:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for f in done:
+                            results[pending.pop(f)] = f.result()
+                    pending[pool.submit(_mine_stratum, args)] = tag
+                for f in pending:
+                    results[pending[f]] = f.result()
+        else:
+            results = {tag: _mine_stratum(args) for tag, args in jobs}
+
+        tables = []
+        for tag, _ in jobs:
+            rules = results[tag]
+            if rules.empty:
+                continue
+            rules.insert(0, "stratum", tag[1])
+            rules.insert(0, "stratum_dimension", tag[0])
+            tables.append(rules)
+
+        if not tables:
+            return pd.DataFrame()
+        return pd.concat(tables, ignore_index=True)
+
+    def run_apriori(
+        self,
+        min_support: float = 0.01,
+        metric: str = "lift",
+        min_threshold: float = 1.0,
+        top_k: int | None = None,
+        min_confidence: float = 0.0,
+    ) -> pd.DataFrame:
+        # Run Apriori on the basket matrix and generate association rules
+        return self.run("apriori", min_support, metric, min_threshold,
+                        top_k, min_confidence)
+
+    def run_fpgrowth(
+        self,
+        min_support: float = 0.01,
+        metric: str = "lift",
+        min_threshold: float = 1.0,
+        top_k: int | None = None,
+        min_confidence: float = 0.0,
+    ) -> pd.DataFrame:
+        # Run FP-Growth on the basket matrix and generate association rules
+        return self.run("fpgrowth", min_support, metric, min_threshold,
+                        top_k, min_confidence)
+
+    def run_eclat(
+        self,
+        min_support: float = 0.01,
+        metric: str = "lift",
+        min_threshold: float = 1.0,
+        top_k: int | None = None,
+        min_confidence: float = 0.0,
+    ) -> pd.DataFrame:
+        # Run the built-in bitset Eclat and generate association rules
+        return self.run("eclat", min_support, metric, min_threshold,
+                        top_k, min_confidence)
@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np # type: ignore
+import pandas as pd # type: ignore
+
+from config import ( # type: ignore
+    RESULTS_DIR, BENCHMARK_DATA_DIR, BENCHMARK_BASELINE,
+)
+from data_loader import DataLoader
+from dataset_cache import DatasetCache
+from stratified_analysis import StratifiedAnalyzer
+from association_rules import AssociationRuleMiner
+from customer_segmentation import CustomerSegmentation
+from synthetic_data import FidelityDataGenerator, GENERATOR_VERSION
+from profiling import profiler
+
+# Default grid: number of receipts (about 9 lines per receipt)
+SIZES = (5_000, 20_000, 80_000)
+ALGORITHMS = ("apriori", "fpgrowth")
+SUPPORTS = (0.05, 0.02, 0.01)
+
+# Allowed slowdown / memory growth relative to the baseline; smaller
+# absolute differences are timer and allocator noise
+TIME_TOLERANCE = 0.30
+MEMORY_TOLERANCE = 0.20
+MIN_TIME_DELTA_S = 0.25
+MIN_MEMORY_DELTA_MB = 25.0
+
+
+# --------------------------------------------------
+# Cases: each one returns the size of its output (rows, rules, ...),
+# which must not change between runs on the same data
+# --------------------------------------------------
+def _load_case(path: Path, df: Optional[pd.DataFrame]) -> int:
+    return len(DataLoader(path).load_streaming())
+
+
+def _stratified_case(path: Path, df: pd.DataFrame) -> int:
+    with tempfile.TemporaryDirectory() as figures_dir:
+        return len(StratifiedAnalyzer(df, figures_dir=Path(figures_dir)).frequencies())
+
+
+def _rules_case(algorithm: str, min_support: float) -> Callable:
+    def run(path: Path, df: pd.DataFrame) -> int:
+        miner = AssociationRuleMiner(df, level_col="liv4", id_col="scontrino_id", sparse=True)
+        return len(miner.run(algorithm=algorithm, min_support=min_support))
+    return run
+
+
+def _segmentation_case(path: Path, df: pd.DataFrame) -> int:
+    segmenter = CustomerSegmentation(df)
+    clusters = segmenter.cluster_cards(n_clusters=5, n_components=5,
+                                       top_n_products=None, sparse=True)
+    return int(clusters["cluster"].nunique())
+
+
+CASES: Dict[str, Callable[[Path, Optional[pd.DataFrame]], int]] = {
+    "load": _load_case,
+    "stratified": _stratified_case,
+    **{f"rules.{algorithm}.{support}": _rules_case(algorithm, support)
+       for algorithm in ALGORITHMS for support in SUPPORTS},
+    "segmentation": _segmentation_case,
+}
+
+
+# --------------------------------------------------
+# Data and execution
+# --------------------------------------------------
+def dataset_path(n_receipts: int, seed: int = 42) -> Path:
+    # Synthetic CSV for a grid size, generated on first use
+    path = BENCHMARK_DATA_DIR / f"synthetic-v{GENERATOR_VERSION}-s{seed}-{n_receipts}.csv"
+    if not path.exists():
+        print(f"[INFO] Generating {n_receipts} synthetic receipts -> {path.name}")
+        FidelityDataGenerator(seed=seed).write_csv(path, n_receipts)
+    return path
+
+
+def _run_case(case: str, path: Path, repeat: int) -> Dict:
+    # Worker (fresh process): preprocessed input outside the measurement,
+    # then the best wall time of `repeat` runs and the highest peak RSS
+    df = None if case == "load" else DataLoader(path).load_cached(DatasetCache(BENCHMARK_DATA_DIR))
+    rows = len(df) if df is not None else None
+
+    profiler.reset()
+    for _ in range(repeat):
+        with profiler.stage(f"bench.{case}") as record:
+            output = CASES[case](path, df)
+            record["sizes"]["output"] = output
+    runs = [r for r in profiler.records if r["stage"] == f"bench.{case}"]
+    best = min(runs, key=lambda r: r["wall_s"])
+    rows = rows if rows is not None else output
+
+    return {
+        "case": case,
+        "rows": rows,
+        "wall_s": round(best["wall_s"], 4),
+        "cpu_s": round(best["cpu_s"], 4),
+        "peak_rss_mb": max(r["peak_rss_mb"] or 0.0 for r in runs),
+        "rows_per_s": round(rows / best["wall_s"], 1) if best["wall_s"] > 0 else None,
+        "output": output,
+    }
+
+
+def run_benchmarks(
+    sizes: Sequence[int] = SIZES,
+    cases: Optional[Sequence[str]] = None,
+    repeat: int = 3,
+    seed: int = 42,
+) -> pd.DataFrame:
+    """
+    Run every case on every grid size, each case in a fresh process so
+    peak memory is not inflated by earlier cases. One row per
+    (case, n_receipts).
+    """
+    cases = list(cases or CASES)
+    rows = []
+    for n_receipts in sizes:
+        path = dataset_path(n_receipts, seed)
+        for case in cases:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                result = pool.submit(_run_case, case, path, repeat).result()
+            result["n_receipts"] = n_receipts
+            print(f"[INFO] {case} @ {n_receipts} receipts: {result['wall_s']:.3f}s, "
+                  f"{result['peak_rss_mb']:.0f} MB, {result['rows_per_s']:.0f} rows/s")
+            rows.append(result)
+    columns = ["case", "n_receipts", "rows", "wall_s", "cpu_s", "rows_per_s",
+               "peak_rss_mb", "output"]
+    return pd.DataFrame(rows, columns=columns)
+
+
+# --------------------------------------------------
+# Baseline
+# --------------------------------------------------
+def environment() -> Dict:
+    import sklearn # type: ignore
+    import mlxtend # type: ignore
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "scikit-learn": sklearn.__version__,
+        "mlxtend": mlxtend.__version__,
+        "generator_version": GENERATOR_VERSION,
+    }
+
+
+def save_baseline(results: pd.DataFrame, path: Path = BENCHMARK_BASELINE) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(),
+                   "results": results.to_dict(orient="records")}, f, indent=2)
+    return path
+
+
+def load_baseline(path: Path = BENCHMARK_BASELINE) -> Tuple[Dict, pd.DataFrame]:
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    return baseline["environment"], pd.DataFrame(baseline["results"])
+
+
+def compare(
+    results: pd.DataFrame,
+    baseline: pd.DataFrame,
+    time_tolerance: float = TIME_TOLERANCE,
+    memory_tolerance: float = MEMORY_TOLERANCE,
+) -> pd.DataFrame:
+    """
+    Join the results with the baseline on (case, n_receipts) and flag
+    each row: "slower" / "more memory" beyond the tolerances and the
+    MIN_*_DELTA absolute floors, "output changed" when the output size
+    differs (a behaviour change, not a performance one), "new" when the
+    baseline has no such row.
+    """
+    merged = results.merge(
+        baseline[["case", "n_receipts", "wall_s", "peak_rss_mb", "output"]],
+        on=["case", "n_receipts"], how="left", suffixes=("", "_baseline"),
+    )
+    merged["time_ratio"] = (merged["wall_s"] / merged["wall_s_baseline"]).round(3)
+    merged["memory_ratio"] = (merged["peak_rss_mb"] / merged["peak_rss_mb_baseline"]).round(3)
+
+    def status(row) -> str:
+        if pd.isna(row["wall_s_baseline"]):
+            return "new"
+        flags = []
+        if row["output"] != row["output_baseline"]:
+            flags.append("output changed")
+        if (row["time_ratio"] > 1.0 + time_tolerance
+                and row["wall_s"] - row["wall_s_baseline"] > MIN_TIME_DELTA_S):
+            flags.append("slower")
+        if (row["memory_ratio"] > 1.0 + memory_tolerance
+                and row["peak_rss_mb"] - row["peak_rss_mb_baseline"] > MIN_MEMORY_DELTA_MB):
+            flags.append("more memory")
+        return ", ".join(flags) or "ok"
+
+    merged["status"] = merged.apply(status, axis=1)
+    return merged
+
+
+# --------------------------------------------------
+# Command line
+# --------------------------------------------------
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the analysis on synthetic data of growing size."
+    )
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES),
+                        help="numbers of receipts (default: %(default)s)")
+    parser.add_argument("--cases", nargs="+", default=None,
+                        help="case names or prefixes, e.g. load rules.fpgrowth "
+                             f"(default: all of {', '.join(CASES)})")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per case; the fastest is kept (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", type=Path, default=BENCHMARK_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store these results as the new baseline")
+    parser.add_argument("--time-tolerance", type=float, default=TIME_TOLERANCE)
+    parser.add_argument("--memory-tolerance", type=float, default=MEMORY_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    cases = None
+    if args.cases:
+        cases = [c for c in CASES if any(c == p or c.startswith(p + ".") for p in args.cases)]
+        if not cases:
+            parser.error(f"No case matches {args.cases}. Choose from: {', '.join(CASES)}")
+
+    results = run_benchmarks(args.sizes, cases, args.repeat, args.seed)
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    results.to_csv(RESULTS_DIR / "benchmark.csv", index=False)
+
+    if args.save_baseline:
+        print(f"[INFO] Baseline saved to {save_baseline(results, args.baseline)}")
+        return 0
+    if not args.baseline.exists():
+        print(f"[INFO] No baseline at {args.baseline}; run with --save-baseline to create one.")
+        return 0
+
+    env, baseline = load_baseline(args.baseline)
+    current = environment()
+    differences = {k: (v, current.get(k)) for k, v in env.items() if current.get(k) != v}
+    if differences:
+        print(f"[WARN] Baseline recorded in a different environment: {differences}")
+
+    comparison = compare(results, baseline, args.time_tolerance, args.memory_tolerance)
+    comparison.to_csv(RESULTS_DIR / "benchmark_comparison.csv", index=False)
+    with pd.option_context("display.width", 160, "display.max_columns", 20):
+        print(comparison[["case", "n_receipts", "wall_s", "time_ratio",
+                          "peak_rss_mb", "memory_ratio", "status"]].to_string(index=False))
+
+    regressions = comparison[~comparison["status"].isin(["ok", "new"])]
+    if len(regressions):
+        print(f"[WARN] {len(regressions)} regression(s) against {args.baseline}")
+        return 1
+    print("[INFO] No regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
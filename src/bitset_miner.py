@@ -0,0 +1,141 @@
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np # type: ignore
+import pandas as pd # type: ignore
+
+# Bits set in each byte value, used when np.bitwise_count is unavailable
+_POPCOUNT8 = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+def popcount_rows(bits: np.ndarray) -> np.ndarray:
+    """
+    Number of set bits in each row of a packed (n, n_bytes) uint8 array.
+    """
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bits).sum(axis=1, dtype=np.int64)
+    return _POPCOUNT8[bits].sum(axis=1, dtype=np.int64)
+
+
+def pack_basket(basket: pd.DataFrame) -> np.ndarray:
+    """
+    Vertical layout of a transaction x item bool DataFrame (dense or
+    sparse): one packed bit array (tidset) per item, shape
+    (n_items, ceil(n_transactions / 8)).
+    """
+    n_transactions, n_items = basket.shape
+    n_bytes = (n_transactions + 7) // 8
+
+    if hasattr(basket, "sparse") and n_items and all(
+        isinstance(dt, pd.SparseDtype) for dt in basket.dtypes
+    ):
+        coo = basket.sparse.to_coo()
+        rows = coo.row[coo.data.astype(bool)]
+        cols = coo.col[coo.data.astype(bool)]
+        bits = np.zeros((n_items, n_bytes), dtype=np.uint8)
+        np.bitwise_or.at(
+            bits,
+            (cols, rows >> 3),
+            (np.uint8(0x80) >> (rows & 7).astype(np.uint8)),
+        )
+        return bits
+
+    return np.packbits(basket.to_numpy(dtype=bool).T, axis=1)
+
+
+def min_support_count(min_support: float, n_transactions: int) -> int:
+    """
+    Smallest absolute count c with c / n_transactions >= min_support,
+    i.e. the same float comparison mlxtend applies to relative supports.
+    """
+    c = int(np.ceil(min_support * n_transactions))
+    while c > 0 and (c - 1) / n_transactions >= min_support:
+        c -= 1
+    while c / n_transactions < min_support:
+        c += 1
+    return c
+
+
+def count_itemsets(bits: np.ndarray, itemsets: List[Tuple[int, ...]]) -> np.ndarray:
+    """
+    Exact absolute support of each itemset (tuples of item positions)
+    from the packed tidsets. Itemsets are processed in sorted order so
+    the AND of a shared prefix is computed only once.
+    """
+    counts = np.zeros(len(itemsets), dtype=np.int64)
+    order = sorted(range(len(itemsets)), key=lambda i: tuple(sorted(itemsets[i])))
+
+    prefix_cache: dict = {}
+    for i in order:
+        items = tuple(sorted(itemsets[i]))
+        prefix = items[:-1]
+        if prefix and prefix not in prefix_cache:
+            prefix_cache = {prefix: np.bitwise_and.reduce(bits[list(prefix)], axis=0)}
+        tidset = bits[items[-1]] if not prefix else prefix_cache[prefix] & bits[items[-1]]
+        counts[i] = popcount_rows(tidset[None, :])[0]
+    return counts
+
+
+def _eclat(
+    prefix: Tuple[int, ...],
+    items: np.ndarray,
+    bits: np.ndarray,
+    counts: np.ndarray,
+    min_count: int,
+    max_len: Optional[int],
+) -> Iterator[Tuple[Tuple[int, ...], int]]:
+    # items/bits/counts: frequent extensions of prefix and their tidsets
+    for i in range(len(items)):
+        itemset = prefix + (int(items[i]),)
+        yield itemset, int(counts[i])
+
+        if i + 1 == len(items) or (max_len is not None and len(itemset) >= max_len):
+            continue
+
+        # Vectorized AND of this tidset with all the following ones
+        new_bits = bits[i + 1:] & bits[i]
+        new_counts = popcount_rows(new_bits)
+        keep = new_counts >= min_count
+        if keep.any():
+            yield from _eclat(itemset, items[i + 1:][keep], new_bits[keep],
+                              new_counts[keep], min_count, max_len)
+
+
+def eclat(
+    df: pd.DataFrame,
+    min_support: float = 0.5,
+    use_colnames: bool = False,
+    max_len: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Frequent itemsets with a bitset-based Eclat (depth-first, vertical
+    layout): supports are computed with vectorized AND + popcount.
+
+    Drop-in replacement for mlxtend's apriori/fpgrowth: same arguments
+    and same output schema (support, itemsets).
+    """
+    n_transactions = df.shape[0]
+    if n_transactions == 0 or df.shape[1] == 0:
+        return pd.DataFrame(columns=["support", "itemsets"])
+
+    bits = pack_basket(df)
+    counts = popcount_rows(bits)
+    min_count = min_support_count(min_support, n_transactions)
+
+    frequent = np.flatnonzero(counts >= min_count)
+    # Ascending support order keeps the intermediate tidsets small
+    frequent = frequent[np.argsort(counts[frequent], kind="stable")]
+
+    found: List[Tuple[Tuple[int, ...], int]] = list(_eclat(
+        (), frequent, bits[frequent], counts[frequent], min_count, max_len
+    ))
+    if not found:
+        return pd.DataFrame(columns=["support", "itemsets"])
+
+    labels = df.columns if use_colnames else range(df.shape[1])
+    itemsets = [frozenset(labels[i] for i in s) for s, _ in found]
+    support = np.array([c for _, c in found], dtype=float) / n_transactions
+
+    out = pd.DataFrame({"support": support, "itemsets": itemsets})
+    # Same ordering as mlxtend: by itemset length
+    lengths = np.array([len(s) for s, _ in found])
+    return out.iloc[np.argsort(lengths, kind="stable")].reset_index(drop=True)
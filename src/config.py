@@ -15,4 +15,28 @@ CARD_COL = "tessera"
 PRODUCT_COL = "cod_prod"
 DESCR_PROD_COL = "descr_prod"
 
+# Derived columns added once by DataLoader preprocessing
+DATETIME_COL = "datetime"      # date + time, datetime64
+MINUTE_COL = "minute_of_day"   # 0..1439
+MONTH_COL = "month"
+DAY_COL = "day"
+
 MERCH_LEVELS = ["liv1", "liv2", "liv3", "liv4"]
+
+# Streaming ingestion
+CHUNK_SIZE = 500_000  # rows per chunk when reading the CSV in streaming mode
+
+# Declared column schema (columns not listed here keep pandas' inferred dtype)
+CATEGORICAL_COLS = MERCH_LEVELS + [DESCR_PROD_COL, CARD_COL]
+INTEGER_COLS = [RECEIPT_COL, PRODUCT_COL]
+
+# Preprocessed-dataset cache
+CACHE_DIR = BASE_DIR / "cache"
+PREPROCESS_VERSION = 2  # bump when DataLoader preprocessing changes
+
+# Rendered figures kept across pipeline runs (unchanged ones are skipped)
+FIGURE_CACHE_DIR = CACHE_DIR / "figures"
+
+# Benchmark suite (synthetic data in the cache, baseline under version control)
+BENCHMARK_DATA_DIR = CACHE_DIR / "benchmark"
+BENCHMARK_BASELINE = BASE_DIR / "benchmarks" / "baseline.json"
@@ -1,11 +1,17 @@
+from pathlib import Path
+from typing import Iterable, Iterator, Tuple
+
 import numpy as np  # type: ignore
 import pandas as pd  # type: ignore
-from sklearn.decomposition import PCA  # type: ignore
-from sklearn.cluster import KMeans  # type: ignore
+import scipy.sparse as sp  # type: ignore
+from sklearn.decomposition import PCA, IncrementalPCA, TruncatedSVD  # type: ignore
+from sklearn.cluster import KMeans, MiniBatchKMeans  # type: ignore
+from sklearn.feature_extraction.text import TfidfTransformer  # type: ignore
 from sklearn.preprocessing import StandardScaler  # type: ignore
-from sklearn.metrics import silhouette_score  # type: ignore
 
-from config import CARD_COL, PRODUCT_COL # type: ignore
+from k_selection import sweep_k, best_k
+from profiling import profiler, describe
+from config import CARD_COL, PRODUCT_COL, CHUNK_SIZE # type: ignore
 
 
 class CustomerSegmentation:
@@ -13,24 +19,58 @@ class CustomerSegmentation:
     """
     Customer segmentation using tessera x product matrix,
     PCA and K-means clustering.
+
+    With sparse=True the matrix is a scipy CSR matrix over the whole
+    catalogue (top_n_products=None), scaled without centering
+    (weighting="standard") or with TF-IDF weights (weighting="tfidf"),
+    and reduced with randomized TruncatedSVD instead of PCA.
+
+    The card x product matrix and its projection are built once per
+    instance and reused by run_pca, choose_k_by_silhouette and
+    cluster_cards; call invalidate_cache() after changing self.df.
+
+    cluster_cards_streaming() is the out-of-core variant: the sparse
+    matrix is accumulated from transaction chunks (e.g.
+    DataLoader.iter_chunks(), so df can be None) and card blocks go
+    through partial_fit of StandardScaler, IncrementalPCA and
+    MiniBatchKMeans, so only one dense block is in memory at a time.
     """
+
+    WEIGHTINGS = ("standard", "tfidf")
     
     def __init__(
         self,
-        df: pd.DataFrame,
+        df: pd.DataFrame | None,
         product_col: str = PRODUCT_COL,
         card_col: str = CARD_COL,
     ):
+        if df is None:
+            # Streaming only: transactions come from cluster_cards_streaming(chunks=...)
+            df = pd.DataFrame(columns=[card_col, product_col, "r_qta_pezzi"])
+
         # Keep only rows with a valid loyalty card id
         self.df = df[(df[card_col].notna()) & (df[card_col] != "")]
         self.product_col = product_col
         self.card_col = card_col
 
         self.card_index = None
-        self.pca: PCA | None = None
-        self.kmeans: KMeans | None = None
+        self.scaler: StandardScaler | TfidfTransformer | None = None
+        self.pca: PCA | TruncatedSVD | IncrementalPCA | None = None
+        self.kmeans: KMeans | MiniBatchKMeans | None = None
         self.explained_variance_ratio_: np.ndarray | None = None
+        self.k_scores_: pd.DataFrame | None = None  # per-k scores and timings
+
+        # Memoized matrices (by top_n_products, sparse) and projections
+        self._matrices: dict = {}
+        self._projections: dict = {}
 
+    def invalidate_cache(self) -> None:
+        # Drop memoized matrices and projections (e.g. after editing self.df)
+        self._matrices.clear()
+        self._projections.clear()
+
+    @profiler("CustomerSegmentation.build_card_product_matrix",
+              sizes=lambda self, *args, **kwargs: describe(self.df))
     def build_card_product_matrix(
         self,
         top_n_products: int | None = 200,
@@ -46,7 +86,7 @@ class CustomerSegmentation:
         # Optionally keep only the top-N most sold products to reduce dimensionality
         if top_n_products is not None:
             product_totals = (
-                df.groupby(self.product_col)["r_qta_pezzi"]
+                df.groupby(self.product_col, observed=True)["r_qta_pezzi"]
                 .sum()
                 .sort_values(ascending=False)
             )
@@ -54,87 +94,159 @@ class CustomerSegmentation:
             df = df[df[self.product_col].isin(top_products)]
 
         mat = (
-            df.groupby([self.card_col, self.product_col])["r_qta_pezzi"]
+            df.groupby([self.card_col, self.product_col], observed=True)["r_qta_pezzi"]
             .sum()
             .unstack()
             .fillna(0)
         )
         return mat
 
+    @profiler("CustomerSegmentation.build_sparse_card_product_matrix",
+              sizes=lambda self, *args, **kwargs: describe(self.df))
+    def build_sparse_card_product_matrix(
+        self,
+        top_n_products: int | None = None,
+    ) -> Tuple[sp.csr_matrix, pd.Index, pd.Index]:
+        # Same quantities as build_card_product_matrix, as a CSR matrix:
+        # returns (matrix, card labels, product labels)
+        if self.card_col not in self.df.columns:
+            raise ValueError(f"Missing card column: {self.card_col}")
+        if self.product_col not in self.df.columns:
+            raise ValueError(f"Missing product column: {self.product_col}")
+
+        quantity = self.df["r_qta_pezzi"].fillna(0).to_numpy(dtype=np.float64)
+        product_codes, products = pd.factorize(self.df[self.product_col], sort=True)
+        keep = product_codes >= 0
+
+        # Optionally keep only the top-N most sold products
+        if top_n_products is not None:
+            totals = np.bincount(product_codes[keep], weights=quantity[keep],
+                                 minlength=len(products))
+            top = np.sort(np.argsort(-totals, kind="stable")[:top_n_products])
+            remap = np.full(len(products), -1, dtype=np.int64)
+            remap[top] = np.arange(len(top))
+            product_codes = np.where(keep, remap[product_codes], -1)
+            products = products[top]
+            keep = product_codes >= 0
+
+        # Cards are coded after the product filter, as in the dense matrix
+        card_codes, cards = pd.factorize(self.df[self.card_col][keep], sort=True)
+
+        # Duplicate (card, product) entries are summed
+        mat = sp.csr_matrix(
+            (quantity[keep], (card_codes, product_codes[keep])),
+            shape=(len(cards), len(products)),
+        )
+        return mat, pd.Index(cards, name=self.card_col), pd.Index(products, name=self.product_col)
+
+    def _card_matrix(self, top_n_products: int | None, sparse: bool):
+        # (matrix, card labels, product labels) for the dense or the
+        # sparse path, built once
+        key = (top_n_products, sparse)
+        if key not in self._matrices:
+            if sparse:
+                self._matrices[key] = self.build_sparse_card_product_matrix(top_n_products)
+            else:
+                mat = self.build_card_product_matrix(top_n_products=top_n_products)
+                self._matrices[key] = (mat, mat.index, mat.columns)
+        return self._matrices[key]
+
+    def _project(self, mat, n_components: int, sparse: bool, weighting: str):
+        # Scale the matrix and reduce it; returns (coords, scaler, reducer)
+        if weighting not in self.WEIGHTINGS:
+            raise ValueError(
+                f"Unknown weighting '{weighting}'. Choose one of: {', '.join(self.WEIGHTINGS)}"
+            )
+
+        if not sparse:
+            scaler = StandardScaler(with_mean=True, with_std=True)
+            mat_scaled = scaler.fit_transform(mat)
+
+            # Do not ask for more components than available features
+            n_comp_eff = min(n_components, mat_scaled.shape[1])
+            reducer = PCA(n_components=n_comp_eff)
+        else:
+            # Centering would densify the matrix: scale only, or TF-IDF
+            if weighting == "tfidf":
+                scaler = TfidfTransformer()
+            else:
+                scaler = StandardScaler(with_mean=False, with_std=True)
+            mat_scaled = scaler.fit_transform(mat)
+
+            # TruncatedSVD needs strictly fewer components than features
+            n_comp_eff = max(1, min(n_components, mat_scaled.shape[1] - 1))
+            reducer = TruncatedSVD(n_components=n_comp_eff,
+                                   algorithm="randomized", random_state=42)
+
+        with profiler.stage(f"{type(reducer).__name__}.fit", **describe(mat_scaled)):
+            coords = reducer.fit_transform(mat_scaled)
+        return coords, scaler, reducer
+
     def run_pca(
         self,
         n_components: int = 10,
         top_n_products: int | None = 200,
+        sparse: bool = False,
+        weighting: str = "standard",
     ) -> np.ndarray:
         # Standardize the matrix and project customers into PCA space
-        mat = self.build_card_product_matrix(top_n_products=top_n_products)
-        self.card_index = mat.index
-
-        scaler = StandardScaler(with_mean=True, with_std=True)
-        mat_scaled = scaler.fit_transform(mat)
-
-        # Do not ask for more components than available features
-        n_comp_eff = min(n_components, mat_scaled.shape[1])
+        key = (top_n_products, sparse, n_components, weighting)
+        if key not in self._projections:
+            mat, cards, _ = self._card_matrix(top_n_products, sparse)
+            coords, scaler, pca = self._project(mat, n_components, sparse, weighting)
+            self._projections[key] = (coords, cards, scaler, pca)
 
-        pca = PCA(n_components=n_comp_eff)
-        coords = pca.fit_transform(mat_scaled)
-
-        self.pca = pca
-        self.explained_variance_ratio_ = pca.explained_variance_ratio_
+        coords, self.card_index, self.scaler, self.pca = self._projections[key]
+        self.explained_variance_ratio_ = self.pca.explained_variance_ratio_
         return coords
 
     def choose_k_by_silhouette(
         self,
         ks=range(2, 9),
         n_components: int = 10,
-        sample_size: int = 3000,
+        sample_size: int | None = 3000,
         top_n_products: int | None = 200,
+        sparse: bool = False,
+        weighting: str = "standard",
+        criterion: str = "silhouette",
+        n_jobs: int | None = None,
     ):
-        # Choose the best k using silhouette score on a (possibly) sampled set of customers
-        mat = self.build_card_product_matrix(top_n_products=top_n_products)
+        # Choose the best k using silhouette score on a (possibly) sampled set of customers.
+        # criterion can also be "simplified_silhouette", "calinski_harabasz"
+        # or "davies_bouldin" (see k_selection.py); k values run in parallel.
+        # The projection is the one fitted on all cards (shared with cluster_cards)
+        coords = self.run_pca(
+            n_components=n_components,
+            top_n_products=top_n_products,
+            sparse=sparse,
+            weighting=weighting,
+        )
 
         # Sample customers to speed up silhouette evaluation
-        if mat.shape[0] > sample_size:
+        if sample_size is not None and coords.shape[0] > sample_size:
             rng = np.random.default_rng(42)
-            sampled_index = rng.choice(mat.index, size=sample_size, replace=False)
-            mat_sample = mat.loc[sampled_index]
-        else:
-            mat_sample = mat
-
-        scaler = StandardScaler(with_mean=True, with_std=True)
-        mat_scaled = scaler.fit_transform(mat_sample)
+            sampled_index = rng.choice(coords.shape[0], size=sample_size, replace=False)
+            coords = coords[sampled_index]
 
-        n_comp_eff = min(n_components, mat_scaled.shape[1])
-        pca = PCA(n_components=n_comp_eff)
-        coords = pca.fit_transform(mat_scaled)
-
-        best_k = None
-        best_score = -1.0
-        scores: dict[int, float] = {}
-
-        for k in ks:
-            # k must be smaller than number of points
-            if k >= coords.shape[0]:
-                continue
-
-            km = KMeans(n_clusters=k, random_state=42, n_init="auto")
-            labels = km.fit_predict(coords)
-            score = silhouette_score(coords, labels)
-            scores[k] = score
+        self.k_scores_ = sweep_k(coords, ks, criteria=(criterion,), n_jobs=n_jobs)
+        scores: dict[int, float] = {
+            int(row.k): float(getattr(row, criterion)) for row in self.k_scores_.itertuples()
+        }
+        k, best_score = best_k(self.k_scores_, criterion)
 
-            if score > best_score:
-                best_score = score
-                best_k = k
-
-        return best_k, best_score, scores
+        return k, best_score, scores
 
     def cluster_cards(
         self,
         n_clusters: int | None = None,
         n_components: int = 10,
         ks=range(2, 9),
-        sample_size: int = 3000,
+        sample_size: int | None = 3000,
         top_n_products: int | None = 200,
+        sparse: bool = False,
+        weighting: str = "standard",
+        criterion: str = "silhouette",
+        n_jobs: int | None = None,
     ) -> pd.DataFrame:
         # Cluster all customers; if k is not provided, select it via silhouette
         if n_clusters is None:
@@ -143,21 +255,28 @@ class CustomerSegmentation:
                 n_components=n_components,
                 sample_size=sample_size,
                 top_n_products=top_n_products,
+                sparse=sparse,
+                weighting=weighting,
+                criterion=criterion,
+                n_jobs=n_jobs,
             )
             if best_k is None:
                 raise RuntimeError("Could not determine a valid k using silhouette.")
 
-            print(f"[INFO] Silhouette scores by k: {scores}")
-            print(f"[INFO] Selected k={best_k} by silhouette (score={best_score:.3f}).")
+            print(f"[INFO] {criterion} scores by k: {scores}")
+            print(f"[INFO] Selected k={best_k} by {criterion} (score={best_score:.3f}).")
             n_clusters = best_k
 
         coords = self.run_pca(
             n_components=n_components,
             top_n_products=top_n_products,
+            sparse=sparse,
+            weighting=weighting,
         )
 
         km = KMeans(n_clusters=n_clusters, random_state=42, n_init="auto")
-        labels = km.fit_predict(coords)
+        with profiler.stage("KMeans.fit", **describe(coords), n_clusters=n_clusters):
+            labels = km.fit_predict(coords)
 
         self.kmeans = km
 
@@ -165,3 +284,152 @@ class CustomerSegmentation:
             self.card_col: self.card_index,
             "cluster": labels,
         })
+
+    @profiler("CustomerSegmentation.stream_sparse_card_product_matrix")
+    def stream_sparse_card_product_matrix(
+        self,
+        chunks: Iterable[pd.DataFrame],
+        top_n_products: int | None = None,
+        compact_rows: int = 2_000_000,
+    ) -> Tuple[sp.csr_matrix, pd.Index, pd.Index]:
+        """
+        Same result as build_sparse_card_product_matrix, accumulated
+        from chunks of transactions instead of self.df. Each chunk is
+        reduced to its (card, product) quantity sums, and the partial
+        sums are merged whenever they exceed compact_rows, so memory is
+        bounded by one chunk plus the non-zero entries of the matrix.
+        """
+        keys = [self.card_col, self.product_col]
+        parts: list = []
+        n_rows = 0
+        for chunk in chunks:
+            missing = [c for c in keys if c not in chunk.columns]
+            if missing:
+                raise ValueError(f"Missing column(s): {', '.join(missing)}")
+            chunk = chunk[chunk[self.card_col].notna() & (chunk[self.card_col] != "")
+                          & chunk[self.product_col].notna()]
+            part = chunk.groupby(keys, observed=True)["r_qta_pezzi"].sum()
+            parts.append(part)
+            n_rows += len(part)
+            if n_rows > compact_rows and len(parts) > 1:
+                parts = [pd.concat(parts).groupby(level=[0, 1]).sum()]
+                n_rows = len(parts[0])
+
+        if not parts:
+            return (sp.csr_matrix((0, 0)), pd.Index([], name=self.card_col),
+                    pd.Index([], name=self.product_col))
+        pairs = pd.concat(parts).groupby(level=[0, 1]).sum()
+        card_values = pairs.index.get_level_values(0)
+        product_codes, products = pd.factorize(pairs.index.get_level_values(1), sort=True)
+        quantity = pairs.to_numpy(dtype=np.float64)
+
+        # Optionally keep only the top-N most sold products (same ranking
+        # as the in-memory matrix)
+        if top_n_products is not None:
+            totals = np.bincount(product_codes, weights=quantity, minlength=len(products))
+            top = np.sort(np.argsort(-totals, kind="stable")[:top_n_products])
+            remap = np.full(len(products), -1, dtype=np.int64)
+            remap[top] = np.arange(len(top))
+            product_codes = remap[product_codes]
+            products = products[top]
+            keep = product_codes >= 0
+            card_values, product_codes, quantity = (
+                card_values[keep], product_codes[keep], quantity[keep])
+
+        card_codes, cards = pd.factorize(card_values, sort=True)
+        mat = sp.csr_matrix(
+            (quantity, (card_codes, product_codes)),
+            shape=(len(cards), len(products)),
+        )
+        return mat, pd.Index(cards, name=self.card_col), pd.Index(products, name=self.product_col)
+
+    def _frame_chunks(self) -> Iterator[pd.DataFrame]:
+        # self.df in row slices, for streaming from an in-memory frame
+        for start in range(0, len(self.df), CHUNK_SIZE):
+            yield self.df.iloc[start:start + CHUNK_SIZE]
+
+    @staticmethod
+    def _card_blocks(n_cards: int, batch_size: int, min_rows: int) -> Iterator[np.ndarray]:
+        # Row positions of consecutive card blocks; blocks are balanced so
+        # none is smaller than min_rows (partial_fit needs enough samples)
+        n_blocks = max(1, -(-n_cards // batch_size))
+        if n_cards >= min_rows:
+            n_blocks = min(n_blocks, n_cards // min_rows)
+        yield from np.array_split(np.arange(n_cards), n_blocks)
+
+    @profiler("CustomerSegmentation.cluster_cards_streaming")
+    def cluster_cards_streaming(
+        self,
+        path: Path,
+        n_clusters: int = 5,
+        n_components: int = 10,
+        top_n_products: int | None = None,
+        batch_size: int = 5000,
+        n_epochs: int = 3,
+        random_state: int = 42,
+        chunks: Iterable[pd.DataFrame] | None = None,
+    ) -> Path:
+        """
+        Out-of-core segmentation: write (card, cluster) rows to path.
+
+        The sparse card x product matrix is accumulated from chunks of
+        transactions (e.g. DataLoader(path).iter_chunks(); by default
+        self.df in row slices), then cards are read in blocks of
+        batch_size rows and densified one block at a time. Passes
+        over shuffled blocks fit StandardScaler, IncrementalPCA and then
+        MiniBatchKMeans (n_epochs passes) with partial_fit; a last pass
+        assigns clusters and appends them to the CSV.
+        Memory is bounded by one chunk, the non-zero entries of the
+        matrix and batch_size x number of products.
+        """
+        if chunks is None:
+            chunks = self._frame_chunks()
+        mat, cards, _ = self.stream_sparse_card_product_matrix(chunks, top_n_products)
+        if mat.shape[0] == 0:
+            raise ValueError("No transactions with a loyalty card to cluster.")
+        n_cards, n_products = mat.shape
+        n_comp_eff = min(n_components, n_products)
+        min_rows = max(n_comp_eff, n_clusters)
+
+        rng = np.random.default_rng(random_state)
+
+        def shuffled_blocks():
+            order = rng.permutation(n_cards)
+            return [order[b] for b in self._card_blocks(n_cards, batch_size, min_rows)]
+
+        def dense(rows: np.ndarray) -> np.ndarray:
+            return mat[rows].toarray()
+
+        fit_blocks = shuffled_blocks()
+        scaler = StandardScaler(with_mean=True, with_std=True)
+        for rows in fit_blocks:
+            scaler.partial_fit(dense(rows))
+
+        pca = IncrementalPCA(n_components=n_comp_eff)
+        for rows in fit_blocks:
+            pca.partial_fit(scaler.transform(dense(rows)))
+
+        km = MiniBatchKMeans(n_clusters=n_clusters, random_state=random_state,
+                             batch_size=min(batch_size, n_cards), n_init="auto")
+        for epoch in range(n_epochs):
+            blocks = fit_blocks if epoch == 0 else shuffled_blocks()
+            for rows in blocks:
+                km.partial_fit(pca.transform(scaler.transform(dense(rows))))
+
+        # Assignment pass in card order, written batch by batch
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            for i, rows in enumerate(self._card_blocks(n_cards, batch_size, min_rows)):
+                labels = km.predict(pca.transform(scaler.transform(dense(rows))))
+                pd.DataFrame({
+                    self.card_col: cards[rows],
+                    "cluster": labels,
+                }).to_csv(f, header=(i == 0), index=False)
+        tmp.replace(path)
+
+        self.card_index = cards
+        self.scaler, self.pca, self.kmeans = scaler, pca, km
+        self.explained_variance_ratio_ = pca.explained_variance_ratio_
+        return path
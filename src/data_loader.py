@@ -1,40 +1,67 @@
 import pandas as pd # type: ignore
+from pandas.api.types import union_categoricals # type: ignore
 from pathlib import Path
-from typing import Optional
-from config import DATE_COL, TIME_COL, DESCR_PROD_COL # type: ignore
+from typing import Iterator, List, Optional, TYPE_CHECKING
+
+from profiling import profiler, describe
+from config import ( # type: ignore
+    DATE_COL, TIME_COL, DESCR_PROD_COL,
+    DATETIME_COL, MINUTE_COL, MONTH_COL, DAY_COL,
+    CATEGORICAL_COLS, INTEGER_COLS, CHUNK_SIZE,
+)
+
+if TYPE_CHECKING:
+    from dataset_cache import DatasetCache
 
 class DataLoader:
     """
     Load and preprocess the supermarket fidelity dataset.
+
+    Two modes are available:
+    - load() + preprocess(): read the whole CSV, then clean it
+    - load_streaming() / iter_chunks(): read the CSV in chunks with a
+      declared schema and clean each chunk as it arrives, so peak memory
+      is bounded by the chunk size plus the (compact) result
+    - load_cached(): like load_streaming(), but reuse a columnar cache of
+      the preprocessed frame when the source and config are unchanged
     """
 
-    def __init__(self, path: Path, sep: str = ",", decimal: str = "."):
+    def __init__(self, path: Path, sep: str = ",", decimal: str = ".",
+                 chunksize: int = CHUNK_SIZE):
         self.path = path
         self.sep = sep
         self.decimal = decimal
+        self.chunksize = chunksize
         self.df: Optional[pd.DataFrame] = None
 
+    def _file_size(self) -> dict:
+        return {"file_mb": round(self.path.stat().st_size / 2**20, 3)}
+
+    @profiler("DataLoader.load", sizes=lambda self: self._file_size())
     def load(self) -> pd.DataFrame:
         self.df = pd.read_csv(self.path, sep=self.sep, decimal=self.decimal)
         return self.df
 
+    @profiler("DataLoader.preprocess", sizes=lambda self: describe(self.df))
     def preprocess(self) -> pd.DataFrame:
         if self.df is None:
             raise RuntimeError("Call load() before preprocess().")
 
-        df = self.df.copy()
+        self.df = self._preprocess_frame(self.df.copy())
+        return self.df
 
+    @staticmethod
+    def _preprocess_frame(df: pd.DataFrame) -> pd.DataFrame:
         # Parse date
         if DATE_COL in df.columns:
             df[DATE_COL] = pd.to_datetime(df[DATE_COL], format="%Y-%m-%d",
                                           errors="coerce")
             df = df.dropna(subset=[DATE_COL])
 
-        # Parse time
+        # Parse time as a time-of-day offset (timedelta64), not Python objects
         if TIME_COL in df.columns:
-            df[TIME_COL] = pd.to_datetime(df[TIME_COL],
-                                          format="%H:%M",
-                                          errors="coerce").dt.time
+            t = pd.to_datetime(df[TIME_COL], format="%H:%M", errors="coerce")
+            df[TIME_COL] = t - t.dt.normalize()
             df = df.dropna(subset=[TIME_COL])
 
         # Remove shoppers (non-product items)
@@ -42,5 +69,86 @@ class DataLoader:
             df = df[~df[DESCR_PROD_COL]
                     .str.contains("SHOPPER", case=False, na=False)]
 
+        return DataLoader.add_datetime_columns(df)
+
+    @staticmethod
+    def add_datetime_columns(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Add the derived datetime, minute-of-day, month and day columns
+        used by the stratified analysis. Expects parsed date/time columns.
+        """
+        if DATE_COL in df.columns:
+            df[MONTH_COL] = df[DATE_COL].dt.month.astype("int8")
+            df[DAY_COL] = df[DATE_COL].dt.day.astype("int8")
+
+        if DATE_COL in df.columns and TIME_COL in df.columns:
+            df[DATETIME_COL] = df[DATE_COL] + df[TIME_COL]
+            df[MINUTE_COL] = (df[TIME_COL] // pd.Timedelta(minutes=1)).astype("int16")
+
+        return df
+
+    def _schema(self) -> dict:
+        # Declared dtypes for the columns actually present in the file
+        header = pd.read_csv(self.path, sep=self.sep, nrows=0).columns
+        dtypes = {c: "Int64" for c in INTEGER_COLS if c in header}
+        # Date and time are parsed explicitly in _preprocess_frame
+        for col in (DATE_COL, TIME_COL):
+            if col in header:
+                dtypes[col] = "string"
+        return dtypes
+
+    def iter_chunks(self) -> Iterator[pd.DataFrame]:
+        """
+        Yield preprocessed chunks of the dataset with the declared schema.
+        """
+        reader = pd.read_csv(
+            self.path,
+            sep=self.sep,
+            decimal=self.decimal,
+            dtype=self._schema(),
+            chunksize=self.chunksize,
+        )
+        with reader:
+            for chunk in reader:
+                chunk = self._preprocess_frame(chunk)
+                # Categorical columns are cast after parsing, so numeric
+                # codes (e.g. liv4) keep their original values
+                for col in CATEGORICAL_COLS:
+                    if col in chunk.columns:
+                        chunk[col] = chunk[col].astype("category")
+                yield chunk
+
+    @profiler("DataLoader.load_streaming", sizes=lambda self: self._file_size())
+    def load_streaming(self) -> pd.DataFrame:
+        """
+        Read and preprocess the dataset chunk by chunk and concatenate
+        the compact chunks into a single frame (stored in self.df).
+        """
+        chunks: List[pd.DataFrame] = list(self.iter_chunks())
+        if not chunks:
+            raise ValueError(f"No rows left after preprocessing: {self.path}")
+
+        # Chunks have different category sets: align them on the union,
+        # otherwise pd.concat falls back to object columns
+        for col in chunks[0].select_dtypes("category").columns:
+            categories = union_categoricals(
+                [c[col] for c in chunks], ignore_order=True
+            ).categories
+            for c in chunks:
+                c[col] = c[col].cat.set_categories(categories)
+
+        self.df = pd.concat(chunks, ignore_index=True)
+        return self.df
+
+    def load_cached(self, cache: "DatasetCache", force: bool = False) -> pd.DataFrame:
+        """
+        Return the preprocessed dataset from cache, building the cache
+        entry with load_streaming() on a miss (or always, with force).
+        """
+        options = {"sep": self.sep, "decimal": self.decimal}
+        df = None if force else cache.load(self.path, **options)
+        if df is None:
+            df = self.load_streaming()
+            cache.save(self.path, df, **options)
         self.df = df
         return self.df
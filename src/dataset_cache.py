@@ -0,0 +1,120 @@
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd # type: ignore
+import pyarrow.feather as feather # type: ignore
+
+from config import ( # type: ignore
+    CACHE_DIR, PREPROCESS_VERSION,
+    DATE_COL, TIME_COL, DESCR_PROD_COL,
+    CATEGORICAL_COLS, INTEGER_COLS,
+)
+
+
+class DatasetCache:
+    """
+    Columnar (Feather) cache of the preprocessed fidelity dataset.
+
+    A cache entry is keyed by the source file (size + mtime, or a full
+    content hash) and by the preprocessing configuration, so any change
+    to the CSV or to config.py produces a new entry. Entries are stored
+    uncompressed, so a read skips CSV parsing and dtype conversion; the
+    frame itself is still a full in-memory copy (categorical and nullable
+    columns cannot be zero-copy views of the Arrow buffers).
+
+    Next to every entry a small JSON sidecar records the source path and
+    loader options, so a new save only evicts the stale entry of the same
+    source and options.
+    """
+
+    def __init__(self, cache_dir: Path = CACHE_DIR, hash_content: bool = False):
+        self.cache_dir = cache_dir
+        self.hash_content = hash_content
+
+    def _source_fingerprint(self, source: Path) -> dict:
+        stat = source.stat()
+        fingerprint = {
+            "path": str(source.resolve()),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+        if self.hash_content:
+            # Slower, but survives touch/copy of an unchanged file
+            h = hashlib.sha256()
+            with open(source, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+            fingerprint = {"sha256": h.hexdigest()}
+        return fingerprint
+
+    def key(self, source: Path, **loader_options) -> str:
+        payload = {
+            "source": self._source_fingerprint(source),
+            "preprocess_version": PREPROCESS_VERSION,
+            "columns": [DATE_COL, TIME_COL, DESCR_PROD_COL],
+            "categorical": CATEGORICAL_COLS,
+            "integer": INTEGER_COLS,
+            "loader": loader_options,
+        }
+        blob = json.dumps(payload, sort_keys=True, default=str).encode()
+        return hashlib.sha256(blob).hexdigest()[:16]
+
+    def path_for(self, source: Path, **loader_options) -> Path:
+        return self.cache_dir / f"{source.stem}-{self.key(source, **loader_options)}.feather"
+
+    def load(self, source: Path, **loader_options) -> Optional[pd.DataFrame]:
+        # Return the cached frame, or None on a cache miss
+        path = self.path_for(source, **loader_options)
+        if not path.exists():
+            return None
+        return self.read(path)
+
+    @staticmethod
+    def read(path: Path) -> pd.DataFrame:
+        # The memory map avoids a buffered read of the file; to_pandas
+        # then builds the frame (a copy) from the mapped Arrow buffers
+        table = feather.read_table(path, memory_map=True)
+        return table.to_pandas()
+
+    @staticmethod
+    def _sidecar(path: Path) -> Path:
+        return path.with_suffix(".json")
+
+    def _stale_entries(self, source: Path, path: Path, owner: dict):
+        # Entries named exactly <stem>-<16 hex key>.feather whose sidecar
+        # names the same source and loader options
+        pattern = re.compile(rf"{re.escape(source.stem)}-[0-9a-f]{{16}}\.feather")
+        for old in self.cache_dir.glob(f"{source.stem}-*.feather"):
+            if old == path or not pattern.fullmatch(old.name):
+                continue
+            try:
+                with open(self._sidecar(old), encoding="utf-8") as f:
+                    if json.load(f) == owner:
+                        yield old
+            except (OSError, ValueError):
+                continue
+
+    def save(self, source: Path, df: pd.DataFrame, **loader_options) -> Path:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self.path_for(source, **loader_options)
+        owner = json.loads(json.dumps(
+            {"source": str(source.resolve()), "loader": loader_options},
+            sort_keys=True, default=str,
+        ))
+
+        # A stale entry of the same source and options is never read again
+        for old in list(self._stale_entries(source, path, owner)):
+            old.unlink()
+            self._sidecar(old).unlink(missing_ok=True)
+
+        # Write to a temporary file first so a crash never leaves a
+        # truncated entry behind
+        tmp = path.with_suffix(".tmp")
+        df.reset_index(drop=True).to_feather(tmp, compression="uncompressed")
+        tmp.replace(path)
+        with open(self._sidecar(path), "w", encoding="utf-8") as f:
+            json.dump(owner, f, sort_keys=True)
+        return path
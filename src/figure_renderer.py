@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import List, Optional
+
+from matplotlib.figure import Figure # type: ignore
+from matplotlib.backends.backend_agg import FigureCanvasAgg # type: ignore
+
+# Bump when the drawing code changes, so cached PNGs are re-rendered
+RENDER_VERSION = 1
+
+
+@dataclass
+class BarChartJob:
+    """
+    Everything needed to draw one bar chart, independent of pyplot state.
+    """
+    path: Path
+    title: str
+    labels: List[str]
+    values: List[float]
+    xlabel: str = ""
+    ylabel: str = "Frequency"
+    dpi: int = 100
+
+    def content_hash(self) -> str:
+        payload = asdict(self)
+        payload["path"] = self.path.name
+        payload["render_version"] = RENDER_VERSION
+        blob = json.dumps(payload, sort_keys=True, default=str).encode()
+        return hashlib.sha256(blob).hexdigest()
+
+    @property
+    def hash_path(self) -> Path:
+        # Sidecar file stored next to the PNG
+        return self.path.with_name(self.path.name + ".sha256")
+
+    def is_up_to_date(self) -> bool:
+        if not self.path.exists() or not self.hash_path.exists():
+            return False
+        return self.hash_path.read_text().strip() == self.content_hash()
+
+
+def render_bar_chart(job: BarChartJob) -> Path:
+    # Object-oriented Figure + Agg canvas: no global pyplot state, safe
+    # to run in worker processes
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    positions = list(range(len(job.values)))
+    ax.bar(positions, job.values, width=0.5)
+    ax.set_xticks(positions, job.labels, rotation=90)
+    ax.set_xlim(-0.5, len(positions) - 0.5)
+    ax.set_title(job.title)
+    ax.set_xlabel(job.xlabel)
+    ax.set_ylabel(job.ylabel)
+    fig.tight_layout()
+    fig.savefig(job.path, dpi=job.dpi)
+
+    job.hash_path.write_text(job.content_hash())
+    return job.path
+
+
+class FigureRenderer:
+    """
+    Collect figure jobs and render them in a process pool, skipping
+    figures whose content hash matches the one stored next to the PNG.
+    """
+
+    def __init__(self, n_jobs: Optional[int] = None, force: bool = False):
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        self.force = force
+        self.jobs: List[BarChartJob] = []
+        self.paths: List[Path] = []  # every figure flushed, drawn or skipped
+        self.n_rendered = 0
+        self.n_skipped = 0
+
+    def submit(self, job: BarChartJob) -> None:
+        self.jobs.append(job)
+
+    def flush(self) -> List[Path]:
+        """
+        Render all pending jobs and return the paths actually (re)drawn.
+        """
+        jobs, self.jobs = self.jobs, []
+        self.paths.extend(j.path for j in jobs)
+        todo = [j for j in jobs if self.force or not j.is_up_to_date()]
+        self.n_skipped += len(jobs) - len(todo)
+
+        if self.n_jobs > 1 and len(todo) > 1:
+            workers = min(self.n_jobs, len(todo))
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                paths = list(pool.map(render_bar_chart, todo))
+        else:
+            paths = [render_bar_chart(j) for j in todo]
+
+        self.n_rendered += len(paths)
+        return paths
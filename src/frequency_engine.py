@@ -0,0 +1,108 @@
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+import pandas as pd # type: ignore
+
+from config import MERCH_LEVELS # type: ignore
+
+GLOBAL_DIMENSION = "all"
+
+FREQ_COLUMNS = ["dimension", "stratum", "level", "category", "count"]
+
+
+class FrequencyEngine:
+    """
+    Category frequencies for every (stratum dimension, stratum,
+    merchandising level, category) from a single grouped aggregation.
+
+    The frame is scanned once, grouping by all strata and all levels
+    together; every per-dimension / per-level table is then a marginal
+    of that (small) combination table. Adding a stratum dimension
+    (store, weekday, card cluster, ...) adds a key to the same groupby
+    instead of another scan.
+    """
+
+    def __init__(self, df: pd.DataFrame, levels: Optional[List[str]] = None):
+        self.df = df
+        self.levels = [l for l in (levels or MERCH_LEVELS) if l in df.columns]
+
+    def compute(
+        self,
+        strata: Optional[Dict[str, Union[str, pd.Series]]] = None,
+        include_global: bool = True,
+    ) -> pd.DataFrame:
+        """
+        Return a tidy table with columns dimension, stratum, level,
+        category, count, sorted by decreasing count within each
+        (dimension, stratum, level).
+
+        strata maps a dimension name to a column of df or to a Series
+        aligned with df's index.
+        """
+        strata = strata or {}
+        if not self.levels:
+            return pd.DataFrame(columns=FREQ_COLUMNS)
+
+        keys = {}
+        for name, values in strata.items():
+            keys[name] = self.df[values] if isinstance(values, str) else values
+        for level in self.levels:
+            keys[level] = self.df[level]
+        keys = pd.DataFrame(keys, index=self.df.index)
+
+        # The only full scan: count every observed key combination
+        combos = (
+            keys.groupby(list(keys.columns), observed=True, dropna=False, sort=False)
+            .size()
+            .rename("count")
+            .reset_index()
+        )
+
+        parts = []
+        dims = ([GLOBAL_DIMENSION] if include_global else []) + list(strata)
+        for dim in dims:
+            for level in self.levels:
+                by = [level] if dim == GLOBAL_DIMENSION else [dim, level]
+                # NaN strata / categories are dropped, as value_counts() does
+                counts = (
+                    combos.groupby(by, observed=True)["count"]
+                    .sum()
+                    .reset_index()
+                )
+                counts = counts[counts["count"] > 0]
+                counts = counts.sort_values("count", ascending=False, kind="stable")
+                if dim != GLOBAL_DIMENSION:
+                    counts = counts.sort_values(dim, kind="stable")
+                parts.append(pd.DataFrame({
+                    "dimension": dim,
+                    "stratum": (GLOBAL_DIMENSION if dim == GLOBAL_DIMENSION
+                                else counts[dim].astype(object)),
+                    "level": level,
+                    "category": counts[level].astype(object),
+                    "count": counts["count"].astype("int64"),
+                }))
+
+        return pd.concat(parts, ignore_index=True)
+
+    @staticmethod
+    def counts_for(table: pd.DataFrame, dimension: str, stratum, level: str) -> pd.Series:
+        # Counts of one (dimension, stratum, level) as a value_counts-like Series
+        sel = table[
+            (table["dimension"] == dimension)
+            & (table["stratum"] == stratum)
+            & (table["level"] == level)
+        ]
+        return pd.Series(sel["count"].to_numpy(),
+                         index=pd.Index(sel["category"].to_numpy(), name=level),
+                         name="count")
+
+    @staticmethod
+    def save(table: pd.DataFrame, path: Path) -> Path:
+        # CSV or Parquet depending on the file suffix
+        if path.suffix == ".parquet":
+            out = table.copy()
+            out["stratum"] = out["stratum"].astype(str)
+            out["category"] = out["category"].astype(str)
+            out.to_parquet(path, index=False)
+        else:
+            table.to_csv(path, index=False)
+        return path
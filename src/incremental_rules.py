@@ -0,0 +1,193 @@
+import json
+from pathlib import Path
+from typing import Callable, Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+import numpy as np # type: ignore
+import pandas as pd # type: ignore
+
+from association_rules import AssociationRuleMiner
+from bitset_miner import pack_basket, count_itemsets, min_support_count
+from support_sampling import negative_border
+
+Itemset = FrozenSet
+
+
+def _json_label(label):
+    # numpy scalars (e.g. int64 liv4 codes) are not JSON serializable
+    return label.item() if hasattr(label, "item") else label
+
+
+class IncrementalRuleMiner(AssociationRuleMiner):
+    """
+    Incremental maintenance of frequent itemsets and association rules
+    as new batches of receipts arrive (FUP with a negative border).
+
+    The state file keeps the exact support counts of the frequent
+    itemsets and of their negative border, the set of items seen so far
+    and the cumulative number of transactions. A new batch is counted on
+    its own; the history is rescanned only for itemsets whose count is
+    unknown, which happens only when a border itemset becomes frequent.
+    The first update() on an empty state is the initial fit.
+    """
+
+    def __init__(
+        self,
+        state_path: Path,
+        min_support: float = 0.01,
+        level_col: str = "liv4",
+        id_col: str = "scontrino_id",
+    ):
+        super().__init__(pd.DataFrame(columns=[id_col, level_col]),
+                         level_col=level_col, id_col=id_col, sparse=True)
+        self.state_path = state_path
+        self.min_support = min_support
+
+        self.items: Set = set()
+        self.counts: Dict[Itemset, int] = {}  # frequent + negative border
+        self.n_rescanned = 0                  # itemsets counted on history in the last update
+
+        if self.state_path.exists():
+            self._load_state()
+
+    # ------------------------------------------------------------------
+    # State persistence
+    # ------------------------------------------------------------------
+    def _load_state(self) -> None:
+        with open(self.state_path, encoding="utf-8") as f:
+            state = json.load(f)
+        if (state["level_col"], state["min_support"]) != (self.level_col, self.min_support):
+            raise ValueError(
+                f"State file {self.state_path} was built for "
+                f"level_col={state['level_col']}, min_support={state['min_support']}"
+            )
+        self.n_transactions = state["n_transactions"]
+        self.items = set(state["items"])
+        self.counts = {frozenset(items): count for items, count in state["counts"]}
+
+    def save_state(self) -> Path:
+        state = {
+            "level_col": self.level_col,
+            "id_col": self.id_col,
+            "min_support": self.min_support,
+            "n_transactions": self.n_transactions,
+            "items": [_json_label(i) for i in self.items],
+            "counts": [
+                [[_json_label(i) for i in itemset], count]
+                for itemset, count in self.counts.items()
+            ],
+        }
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        tmp.replace(self.state_path)
+        return self.state_path
+
+    # ------------------------------------------------------------------
+    # Counting
+    # ------------------------------------------------------------------
+    def _encode(self, df: pd.DataFrame) -> Tuple[Dict, np.ndarray, int]:
+        # Item label -> column position, packed tidsets, number of receipts
+        miner = AssociationRuleMiner(df, level_col=self.level_col,
+                                     id_col=self.id_col, sparse=True)
+        basket = miner._build_transaction_matrix()
+        positions = {label: i for i, label in enumerate(basket.columns)}
+        return positions, pack_basket(basket), miner.n_transactions
+
+    @staticmethod
+    def _count(encoded: Tuple[Dict, np.ndarray, int],
+               itemsets: Iterable[Itemset]) -> Dict[Itemset, int]:
+        positions, bits, _ = encoded
+        itemsets = list(itemsets)
+        counts = {s: 0 for s in itemsets}
+
+        # Itemsets with an item absent from this data have count 0
+        present = [s for s in itemsets if all(i in positions for i in s)]
+        if present:
+            coded = [tuple(positions[i] for i in s) for s in present]
+            counts.update(zip(present, count_itemsets(bits, coded).tolist()))
+        return counts
+
+    def _frequent(self, min_count: int) -> Set[Itemset]:
+        return {s for s, c in self.counts.items() if c >= min_count}
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def update(
+        self,
+        batch: pd.DataFrame,
+        history_loader: Optional[Callable[[], pd.DataFrame]] = None,
+    ) -> pd.DataFrame:
+        """
+        Add a batch of receipts and return the refreshed rules.
+
+        history_loader returns the receipts already included in the
+        state (without the batch). It is only called when an itemset
+        crosses the negative border and its count on the history is
+        unknown.
+        """
+        batch_enc = self._encode(batch)
+        batch_items = set(batch_enc[0])
+        old_items = set(self.items)
+        n_history = self.n_transactions
+
+        # 1) Tracked itemsets: add their counts in the batch
+        batch_counts = self._count(batch_enc, self.counts)
+        for itemset, count in batch_counts.items():
+            self.counts[itemset] += count
+        self.items |= batch_items
+        self.n_transactions = n_history + batch_enc[2]
+        min_count = min_support_count(self.min_support, self.n_transactions)
+
+        # 2) Grow the frequent set until its negative border is fully
+        #    counted. Unknown itemsets only appear when something crossed
+        #    the border (or when the batch brings never-seen items).
+        history_enc = None
+        self.n_rescanned = 0
+        frequent = self._frequent(min_count)
+        while True:
+            border = negative_border(frequent, self.items)
+            unknown = [s for s in border | frequent if s not in self.counts]
+            if not unknown:
+                break
+
+            counts = self._count(batch_enc, unknown)
+            # Itemsets with a never-seen item cannot occur in the history
+            need_history = [s for s in unknown if s <= old_items]
+            if need_history and n_history > 0:
+                if history_loader is None:
+                    raise RuntimeError(
+                        "An itemset crossed the negative border: "
+                        "history_loader is required to rescan the history."
+                    )
+                if history_enc is None:
+                    history_enc = self._encode(history_loader())
+                for itemset, count in self._count(history_enc, need_history).items():
+                    counts[itemset] += count
+                self.n_rescanned += len(need_history)
+
+            self.counts.update(counts)
+            frequent = self._frequent(min_count)
+
+        # 3) Keep only the frequent itemsets and their negative border
+        keep = frequent | negative_border(frequent, self.items)
+        self.counts = {s: c for s, c in self.counts.items() if s in keep}
+
+        self.save_state()
+        return self.rules()
+
+    def frequent_itemsets(self) -> pd.DataFrame:
+        # Same schema as mlxtend's apriori/fpgrowth output
+        if self.n_transactions == 0:
+            return pd.DataFrame(columns=["support", "itemsets"])
+        min_count = min_support_count(self.min_support, self.n_transactions)
+        frequent = sorted(self._frequent(min_count), key=len)
+        return pd.DataFrame({
+            "support": [self.counts[s] / self.n_transactions for s in frequent],
+            "itemsets": frequent,
+        })
+
+    def rules(self, metric: str = "lift", min_threshold: float = 1.0) -> pd.DataFrame:
+        # support_abs / coverage_abs use the cumulative transaction count
+        return self._rules_from_itemsets(self.frequent_itemsets(), metric, min_threshold)
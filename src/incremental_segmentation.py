@@ -0,0 +1,338 @@
+from pathlib import Path
+from typing import Optional, Tuple
+
+import joblib # type: ignore
+import numpy as np # type: ignore
+import pandas as pd # type: ignore
+import scipy.sparse as sp # type: ignore
+from sklearn.cluster import KMeans # type: ignore
+
+from customer_segmentation import CustomerSegmentation
+from profiling import profiler, describe
+from config import CARD_COL, PRODUCT_COL # type: ignore
+
+
+def _grow(matrix: sp.csr_matrix, shape: Tuple[int, int]) -> sp.csr_matrix:
+    # Pad a CSR matrix with empty rows / columns up to shape (no copy of
+    # the stored entries)
+    indptr = np.pad(matrix.indptr, (0, shape[0] - matrix.shape[0]), mode="edge")
+    return sp.csr_matrix((matrix.data, matrix.indices, indptr), shape=shape)
+
+
+class IncrementalSegmentation(CustomerSegmentation):
+    """
+    Customer segmentation that is fitted once and then kept up to date
+    with daily batches of transactions, without refitting.
+
+    The model file (joblib) holds the fitted scaler, TruncatedSVD and
+    KMeans, the product vocabulary and the current cluster of every
+    card. The sparse card x product quantity matrix is stored next to
+    it (<model>.matrix.npz) and update() only appends the batch rows as
+    a small delta file (<model>.delta-*.npz), so a daily update does not
+    rewrite the matrix; after max_deltas updates the deltas are merged
+    into a new matrix file. update() re-projects only the cards present
+    in the batch and assigns them to the nearest centroid. Products
+    never seen at fit time get new matrix columns but are ignored by
+    the model until the next refit.
+
+    With drift_threshold set, update() refits the whole model from the
+    stored matrix when the mean squared distance of the updated cards to
+    their centroid grows by more than drift_threshold (relative to the
+    fit), or when more than max_unknown_share of the batch quantity is
+    on products unknown to the model.
+    """
+
+    def __init__(
+        self,
+        model_path: Path,
+        card_col: str = CARD_COL,
+        product_col: str = PRODUCT_COL,
+        drift_threshold: Optional[float] = None,
+        max_unknown_share: float = 0.05,
+        max_deltas: int = 30,
+    ):
+        super().__init__(pd.DataFrame(columns=[card_col, product_col, "r_qta_pezzi"]),
+                         product_col=product_col, card_col=card_col)
+        self.model_path = model_path
+        self.drift_threshold = drift_threshold
+        self.max_unknown_share = max_unknown_share
+        self.max_deltas = max_deltas
+
+        self.matrix: sp.csr_matrix | None = None
+        self.products: pd.Index | None = None
+        self.labels: np.ndarray | None = None
+        self.n_clusters = 0
+        self.n_components = 0
+        self.weighting = "standard"
+        self.reference_inertia = 0.0  # mean squared distance to centroid at fit
+        self.generation = 0  # matrix file written by the last save_model()
+        self.n_deltas = 0    # batches appended to it since
+
+        # Set by the last update()
+        self.drift_ = 0.0
+        self.unknown_share_ = 0.0
+        self.refitted = False
+
+        if self.model_path.exists():
+            self._load_model()
+
+    # ------------------------------------------------------------------
+    # Model persistence
+    # ------------------------------------------------------------------
+    @property
+    def matrix_path(self) -> Path:
+        return self.model_path.with_suffix(".matrix.npz")
+
+    def _delta_path(self, generation: int, i: int) -> Path:
+        return self.model_path.with_name(
+            f"{self.model_path.stem}.delta-{generation}-{i:05d}.npz"
+        )
+
+    @staticmethod
+    def _write_npz(path: Path, **arrays) -> None:
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        tmp.replace(path)
+
+    def _read_matrix(self, generation: int, n_deltas: int) -> sp.csr_matrix:
+        # Matrix file of the generation plus its first n_deltas batches
+        with np.load(self.matrix_path) as f:
+            if int(f["generation"]) != generation:
+                raise ValueError(
+                    f"{self.matrix_path} does not belong to {self.model_path} "
+                    "(interrupted save?): fit the model again"
+                )
+            matrix = sp.csr_matrix((f["data"], f["indices"], f["indptr"]),
+                                   shape=tuple(f["shape"]))
+        for i in range(1, n_deltas + 1):
+            with np.load(self._delta_path(generation, i)) as f:
+                shape = tuple(f["shape"])
+                matrix = _grow(matrix, shape) + sp.csr_matrix(
+                    (f["data"], (f["row"], f["col"])), shape=shape
+                )
+        return matrix
+
+    def _load_model(self) -> None:
+        state = joblib.load(self.model_path)
+        if (state["card_col"], state["product_col"]) != (self.card_col, self.product_col):
+            raise ValueError(
+                f"Model file {self.model_path} was built for "
+                f"card_col={state['card_col']}, product_col={state['product_col']}"
+            )
+        self.scaler, self.pca, self.kmeans = state["scaler"], state["pca"], state["kmeans"]
+        self.card_index = state["cards"]
+        if "matrix" in state:
+            # Older model files embed the matrix
+            self.matrix = state["matrix"]
+        else:
+            self.generation, self.n_deltas = state["generation"], state["n_deltas"]
+            self.matrix = self._read_matrix(self.generation, self.n_deltas)
+        self.products, self.labels = state["products"], state["labels"]
+        self.n_clusters, self.n_components = state["n_clusters"], state["n_components"]
+        self.weighting = state["weighting"]
+        self.reference_inertia = state["reference_inertia"]
+        self.explained_variance_ratio_ = self.pca.explained_variance_ratio_
+
+    def _save_state(self) -> None:
+        state = {
+            "card_col": self.card_col,
+            "product_col": self.product_col,
+            "scaler": self.scaler,
+            "pca": self.pca,
+            "kmeans": self.kmeans,
+            "generation": self.generation,
+            "n_deltas": self.n_deltas,
+            "cards": self.card_index,
+            "products": self.products,
+            "labels": self.labels,
+            "n_clusters": self.n_clusters,
+            "n_components": self.n_components,
+            "weighting": self.weighting,
+            "reference_inertia": self.reference_inertia,
+        }
+        self.model_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.model_path.with_suffix(".tmp")
+        joblib.dump(state, tmp)
+        tmp.replace(self.model_path)
+
+    def save_model(self) -> Path:
+        """
+        Write the whole matrix as a new generation, then the model file;
+        the files of older generations are removed afterwards.
+        """
+        self.model_path.parent.mkdir(parents=True, exist_ok=True)
+        self.generation += 1
+        self.n_deltas = 0
+        matrix = self.matrix.tocsr()
+        self._write_npz(self.matrix_path, data=matrix.data, indices=matrix.indices,
+                        indptr=matrix.indptr, shape=np.array(matrix.shape),
+                        generation=np.array(self.generation))
+        self._save_state()
+        for old in self.model_path.parent.glob(f"{self.model_path.stem}.delta-*.npz"):
+            if not old.name.startswith(f"{self.model_path.stem}.delta-{self.generation}-"):
+                old.unlink()
+        return self.model_path
+
+    def _append_delta(self, delta: sp.csr_matrix) -> Path:
+        # Store only the batch rows, or merge everything after max_deltas
+        if self.n_deltas >= self.max_deltas:
+            return self.save_model()
+        coo = delta.tocoo()
+        self._write_npz(self._delta_path(self.generation, self.n_deltas + 1),
+                        data=coo.data, row=coo.row, col=coo.col,
+                        shape=np.array(coo.shape))
+        self.n_deltas += 1
+        self._save_state()
+        return self.model_path
+
+    # ------------------------------------------------------------------
+    # Projection
+    # ------------------------------------------------------------------
+    def _coords(self, rows: sp.csr_matrix) -> np.ndarray:
+        # Only the columns known to the model (the vocabulary at fit time)
+        return self.pca.transform(self.scaler.transform(rows[:, :self.scaler.n_features_in_]))
+
+    def _assign(self, coords: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Nearest centroid and squared distance to it
+        dist = self.kmeans.transform(coords)
+        labels = dist.argmin(axis=1)
+        return labels, dist[np.arange(len(labels)), labels] ** 2
+
+    def _vectorize(self, batch: pd.DataFrame) -> Tuple[sp.csr_matrix, pd.Index, pd.Index]:
+        # Batch quantities as (cards x products) rows in the matrix
+        # vocabulary, plus the batch cards and the products never seen
+        batch = batch[batch[self.card_col].notna() & (batch[self.card_col] != "")
+                      & batch[self.product_col].notna()]
+        card_codes, cards = pd.factorize(batch[self.card_col], sort=True)
+        new_products = pd.Index(batch[self.product_col].unique()).difference(self.products)
+        vocabulary = self.products.append(new_products)
+
+        quantity = batch["r_qta_pezzi"].fillna(0).to_numpy(dtype=np.float64)
+        rows = sp.csr_matrix(
+            (quantity, (card_codes, vocabulary.get_indexer(batch[self.product_col]))),
+            shape=(len(cards), len(vocabulary)),
+        )
+        return rows, pd.Index(cards, name=self.card_col), new_products
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def fit(
+        self,
+        df: pd.DataFrame,
+        n_clusters: int | None = None,
+        n_components: int = 10,
+        weighting: str = "standard",
+        **kwargs,
+    ) -> pd.DataFrame:
+        """
+        Full fit on the whole catalogue (sparse path of cluster_cards,
+        extra kwargs are passed to it), then save the model.
+        """
+        self.df = df[(df[self.card_col].notna()) & (df[self.card_col] != "")]
+        self.invalidate_cache()
+        clusters = self.cluster_cards(n_clusters=n_clusters, n_components=n_components,
+                                      top_n_products=None, sparse=True,
+                                      weighting=weighting, **kwargs)
+
+        self.matrix, _, self.products = self._card_matrix(None, sparse=True)
+        self.labels = clusters["cluster"].to_numpy()
+        self.n_clusters = self.kmeans.n_clusters
+        self.n_components, self.weighting = n_components, weighting
+        self.reference_inertia = self.kmeans.inertia_ / len(self.labels)
+
+        # The raw transactions are not needed anymore
+        self.df = self.df.iloc[:0]
+        self.invalidate_cache()
+        self.save_model()
+        return clusters
+
+    def refit(self) -> pd.DataFrame:
+        # Full refit of scaler, reducer and KMeans on the stored matrix,
+        # over the current vocabulary
+        coords, self.scaler, self.pca = self._project(
+            self.matrix, self.n_components, True, self.weighting
+        )
+        self.kmeans = KMeans(n_clusters=self.n_clusters, random_state=42, n_init="auto")
+        with profiler.stage("KMeans.fit", **describe(coords), n_clusters=self.n_clusters):
+            self.labels = self.kmeans.fit_predict(coords)
+        self.reference_inertia = self.kmeans.inertia_ / len(self.labels)
+        self.explained_variance_ratio_ = self.pca.explained_variance_ratio_
+        self.save_model()
+        return self.clusters()
+
+    def _empty(self) -> pd.DataFrame:
+        return pd.DataFrame({self.card_col: pd.Index([], dtype=self.card_index.dtype),
+                             "cluster": np.array([], dtype=np.int64)})
+
+    def clusters(self) -> pd.DataFrame:
+        return pd.DataFrame({self.card_col: self.card_index, "cluster": self.labels})
+
+    def coordinates(self) -> np.ndarray:
+        # Current embedding of every card (rows follow self.card_index)
+        return self._coords(self.matrix)
+
+    def predict(self, batch: pd.DataFrame) -> pd.DataFrame:
+        """
+        Cluster of each card of the batch, from the batch transactions
+        alone (the stored model and matrix are not changed).
+        """
+        if self.kmeans is None:
+            raise RuntimeError("No fitted model: call fit() first.")
+        rows, cards, _ = self._vectorize(batch)
+        if len(cards) == 0:
+            return self._empty()
+        labels, _ = self._assign(self._coords(rows))
+        return pd.DataFrame({self.card_col: cards, "cluster": labels})
+
+    @profiler("IncrementalSegmentation.update",
+              sizes=lambda self, batch: describe(batch))
+    def update(self, batch: pd.DataFrame) -> pd.DataFrame:
+        """
+        Add a batch of transactions and return the (card, cluster) rows
+        of the new or changed cards. If the drift check fires, the model
+        is refitted and all cards are returned (self.refitted is True).
+        A batch without carded rows changes nothing.
+        """
+        if self.kmeans is None:
+            raise RuntimeError("No fitted model: call fit() first.")
+        rows, cards, new_products = self._vectorize(batch)
+        self.drift_, self.unknown_share_, self.refitted = 0.0, 0.0, False
+        if len(cards) == 0:
+            return self._empty()
+
+        # New products -> new columns, new cards -> new rows; everything
+        # is computed before the model is changed, so an error leaves it
+        # as it was
+        products = self.products.append(new_products)
+        card_index = self.card_index.append(cards.difference(self.card_index))
+        shape = (len(card_index), len(products))
+        positions = card_index.get_indexer(cards)
+        coo = rows.tocoo()
+        delta = sp.csr_matrix((coo.data, (positions[coo.row], coo.col)), shape=shape)
+        matrix = _grow(self.matrix, shape) + delta
+
+        # Re-project and assign only the touched cards
+        labels, sq_dist = self._assign(self._coords(matrix[positions]))
+
+        self.products, self.card_index, self.matrix = products, card_index, matrix
+        self.labels = np.concatenate([
+            self.labels, np.zeros(shape[0] - len(self.labels), dtype=self.labels.dtype)
+        ])
+        self.labels[positions] = labels
+
+        total = rows.sum()
+        known = rows[:, :self.scaler.n_features_in_].sum()
+        self.unknown_share_ = float(1.0 - known / total) if total else 0.0
+        self.drift_ = (float(sq_dist.mean() / self.reference_inertia - 1.0)
+                       if len(sq_dist) and self.reference_inertia else 0.0)
+
+        self.refitted = self.drift_threshold is not None and (
+            self.drift_ > self.drift_threshold or self.unknown_share_ > self.max_unknown_share
+        )
+        if self.refitted:
+            return self.refit()
+
+        self._append_delta(delta)
+        return pd.DataFrame({self.card_col: cards, "cluster": labels})
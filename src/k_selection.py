@@ -0,0 +1,165 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np # type: ignore
+import pandas as pd # type: ignore
+from sklearn.cluster import KMeans # type: ignore
+from sklearn.metrics import calinski_harabasz_score, davies_bouldin_score # type: ignore
+from sklearn.metrics.pairwise import euclidean_distances # type: ignore
+from threadpoolctl import threadpool_limits # type: ignore
+
+# Criterion -> True if higher is better
+CRITERIA = {
+    "silhouette": True,
+    "simplified_silhouette": True,
+    "calinski_harabasz": True,
+    "davies_bouldin": False,
+}
+
+# Points of the current sweep, set once per worker process
+_X: Optional[np.ndarray] = None
+
+
+def silhouette_blockwise(
+    X: np.ndarray,
+    labels: np.ndarray,
+    block_size: int = 1024,
+) -> float:
+    """
+    Mean silhouette coefficient (same value as sklearn's
+    silhouette_score), computed block by block: only a
+    (block_size, n) distance matrix is in memory at a time.
+    """
+    n = X.shape[0]
+    codes, labels = np.unique(labels, return_inverse=True)
+    sizes = np.bincount(labels).astype(float)
+    onehot = np.zeros((n, len(codes)))
+    onehot[np.arange(n), labels] = 1.0
+
+    s = np.empty(n)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        # Sum of distances from each point of the block to each cluster
+        cluster_sums = euclidean_distances(X[start:stop], X) @ onehot
+        own = labels[start:stop]
+        rows = np.arange(stop - start)
+
+        own_size = sizes[own]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            a = cluster_sums[rows, own] / (own_size - 1)
+            means = cluster_sums / sizes
+        means[rows, own] = np.inf
+        b = means.min(axis=1)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            block = (b - a) / np.maximum(a, b)
+        # Singleton clusters have silhouette 0 (sklearn convention)
+        block[own_size == 1] = 0.0
+        s[start:stop] = np.nan_to_num(block)
+    return float(s.mean())
+
+
+def simplified_silhouette(
+    X: np.ndarray,
+    labels: np.ndarray,
+    centers: np.ndarray,
+) -> float:
+    """
+    Centroid-based approximation of the silhouette, O(n * k): a is the
+    distance to the own centroid, b the distance to the nearest other
+    centroid.
+    """
+    dist = euclidean_distances(X, centers)
+    rows = np.arange(X.shape[0])
+    a = dist[rows, labels]
+    dist[rows, labels] = np.inf
+    b = dist.min(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = (b - a) / np.maximum(a, b)
+    return float(np.nan_to_num(s).mean())
+
+
+def _init_worker(X: np.ndarray, single_thread: bool) -> None:
+    global _X
+    _X = X
+    # One BLAS/OpenMP thread per process when k values run in parallel
+    if single_thread:
+        threadpool_limits(limits=1)
+
+
+def _evaluate_k(args) -> Dict:
+    # Fit KMeans for one k and compute the requested criteria, with timings
+    k, criteria, block_size, random_state = args
+    X = _X
+
+    start = perf_counter()
+    km = KMeans(n_clusters=k, random_state=random_state, n_init="auto")
+    labels = km.fit_predict(X)
+    row = {"k": k, "fit_s": perf_counter() - start}
+
+    for criterion in criteria:
+        start = perf_counter()
+        if criterion == "silhouette":
+            score = silhouette_blockwise(X, labels, block_size)
+        elif criterion == "simplified_silhouette":
+            score = simplified_silhouette(X, labels, km.cluster_centers_)
+        elif criterion == "calinski_harabasz":
+            score = calinski_harabasz_score(X, labels)
+        else:
+            score = davies_bouldin_score(X, labels)
+        row[criterion] = float(score)
+        row[f"{criterion}_s"] = perf_counter() - start
+    return row
+
+
+def sweep_k(
+    X: np.ndarray,
+    ks: Iterable[int] = range(2, 9),
+    criteria: Sequence[str] = ("silhouette",),
+    n_jobs: Optional[int] = None,
+    block_size: int = 1024,
+    random_state: int = 42,
+) -> pd.DataFrame:
+    """
+    Fit KMeans for every k in ks (k < number of points) and score each
+    clustering with the given criteria.
+
+    k values run concurrently in a process pool; the points are sent
+    once per worker. Returns one row per k with the fit time, each
+    score and the time spent on it (<criterion>_s).
+    """
+    unknown = [c for c in criteria if c not in CRITERIA]
+    if unknown:
+        raise ValueError(
+            f"Unknown criteria {unknown}. Choose among: {', '.join(CRITERIA)}"
+        )
+
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    jobs = [(k, tuple(criteria), block_size, random_state)
+            for k in ks if k < X.shape[0]]
+    n_jobs = min(n_jobs or os.cpu_count() or 1, max(len(jobs), 1))
+
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                 initargs=(X, True)) as pool:
+            rows = list(pool.map(_evaluate_k, jobs))
+    else:
+        _init_worker(X, False)
+        try:
+            rows = [_evaluate_k(job) for job in jobs]
+        finally:
+            _init_worker(None, False)
+
+    columns = ["k", "fit_s"] + [c for crit in criteria for c in (crit, f"{crit}_s")]
+    return pd.DataFrame(rows, columns=columns)
+
+
+def best_k(table: pd.DataFrame, criterion: str = "silhouette") -> Tuple[Optional[int], float]:
+    # Best (k, score) of a sweep_k table for one criterion
+    if table.empty:
+        return None, float("nan")
+    scores = table.set_index("k")[criterion]
+    k = scores.idxmax() if CRITERIA[criterion] else scores.idxmin()
+    return int(k), float(scores[k])
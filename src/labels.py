@@ -0,0 +1,32 @@
+import numpy as np # type: ignore
+
+
+def normalize_labels(values) -> np.ndarray:
+    """
+    Ids (cards, liv4 items) as int64 when they are all integral, otherwise
+    as text. Columns with missing values are read as floats (1057.0), so
+    integral floats become integers too. Stores keep ids in this form so
+    they survive a save/load round trip without pickles.
+    """
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.integer):
+        return values.astype(np.int64)
+    try:
+        numbers = values.astype(np.float64)
+    except (TypeError, ValueError):
+        return values.astype(str)
+    if np.isfinite(numbers).all() and (numbers == np.round(numbers)).all():
+        return numbers.astype(np.int64)
+    return values.astype(str)
+
+
+def label_key(value, integer: bool):
+    # Lookup key of a query id among normalized labels: 1057, 1057.0 and
+    # "1057" all map to 1057 when the labels are integers (None: no match)
+    if not integer:
+        return str(value)
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return int(number) if np.isfinite(number) and number.is_integer() else None
@@ -1,110 +1,287 @@
-from config import DATA_PATH, FIGURES_DIR, RESULTS_DIR # type: ignore
+import argparse
+import json
+import shutil
+from pathlib import Path
+
+from config import DATA_PATH, FIGURES_DIR, RESULTS_DIR, FIGURE_CACHE_DIR # type: ignore
 from data_loader import DataLoader
+from dataset_cache import DatasetCache
+from figure_renderer import FigureRenderer
 from stratified_analysis import StratifiedAnalyzer
 from association_rules import AssociationRuleMiner
-from customer_segmentation import CustomerSegmentation
-import numpy as np # type: ignore
+from incremental_segmentation import IncrementalSegmentation
+from rule_store import RuleStore
+from similarity_index import SimilarityIndex
+from pipeline import Pipeline, Stage, StageContext
+from profiling import profiler
+import pandas as pd # type: ignore
 
 
-def main():
-    # Create output directories if they do not exist
-    FIGURES_DIR.mkdir(parents=True, exist_ok=True)
-    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+# --------------------------------------------------
+# Stages (each one reads its inputs and writes into ctx.out_dir)
+# --------------------------------------------------
+def _dataset_fingerprint(params: dict) -> str:
+    # Source file + preprocessing configuration
+    loader = DataLoader(Path(params["source"]))
+    return DatasetCache().key(loader.path, sep=loader.sep, decimal=loader.decimal)
+
 
-    # --------------------------------------------------
+def load_stage(ctx: StageContext) -> dict:
     # 1) Load and preprocess data
-    # --------------------------------------------------
-    loader = DataLoader(DATA_PATH)
-    df = loader.load()
-    df = loader.preprocess()
+    # Streaming mode: chunked read with a declared schema keeps memory bounded.
+    # The preprocessed frame is cached on disk (Feather) and read back by
+    # the other stages.
+    loader = DataLoader(Path(ctx.params["source"]))
+    cache = DatasetCache()
+    df = loader.load_cached(cache, force=ctx.force)
 
     print(f"[INFO] Dataset after preprocessing: {df.shape[0]} rows, {df.shape[1]} columns")
+    return {"dataset": cache.path_for(loader.path, sep=loader.sep, decimal=loader.decimal)}
 
-    # --------------------------------------------------
+
+def _dataset(ctx: StageContext) -> pd.DataFrame:
+    return DatasetCache.read(ctx.inputs["load"]["dataset"])
+
+
+def merchandising_stage(ctx: StageContext) -> dict:
     # 2) Task 1 & Task 2: Merchandising analysis (global + stratified)
-    # --------------------------------------------------
     print("[INFO] Running merchandising analysis (Task 1 & 2)...")
-    strat = StratifiedAnalyzer(df, figures_dir=FIGURES_DIR)
+    # Figures are rendered into a directory that outlives the stage's
+    # out_dir, so the renderer skips those whose content hash has not
+    # changed since the last run; this run's figures are then copied out
+    renderer = FigureRenderer(n_jobs=ctx.n_jobs, force=ctx.force)
+    strat = StratifiedAnalyzer(_dataset(ctx), figures_dir=FIGURE_CACHE_DIR, renderer=renderer)
     # Task 1: global top/bottom categories for liv1–liv4
     strat.run_task1()
     # Task 2: stratification by month ranges (R1/R2/R3)
     strat.run_month_ranges()
     # Task 2: stratification by time slots (S1/S2/S3)
     strat.run_time_slots()
+    # All plotted counts come from one frequency table; keep it for reuse
+    frequencies = strat.save_frequencies(ctx.out_dir / "category_frequencies.csv")
+    figures_dir = ctx.out_dir / "figures"
+    figures_dir.mkdir()
+    for path in renderer.paths:
+        shutil.copy2(path, figures_dir / path.name)
+    print(f"[INFO] Figures: {renderer.n_rendered} rendered, {renderer.n_skipped} unchanged.")
     print("[INFO] Merchandising analysis done. Figures saved in '../figures/'.")
+    return {"figures": figures_dir, "frequencies": frequencies}
 
-    # --------------------------------------------------
+
+def rules_stage(ctx: StageContext) -> dict:
     # 3) Task 3 & Task 4: Association rules (Apriori + FP-Growth)
-    # --------------------------------------------------
     print("[INFO] Preparing data for association rules (Tasks 3 & 4)...")
+    params = ctx.params
+    print(f"[INFO] Using min_support={params['min_support']:.2f} for association rules.")
+
+    print("[INFO] Mining association rules with Apriori and FP-Growth...")
+    # Sparse basket: built from integer codes, pruned before densification.
+    # Both algorithms share the same (memoized) basket. Each one mines a
+    # receipt sample sized for the epsilon/delta support error bound and
+    # verifies the result on all receipts (exact supports).
+    miner = AssociationRuleMiner(_dataset(ctx), level_col="liv4", id_col="scontrino_id",
+                                 sparse=True)
+    comparison, rules = miner.compare_algorithms(
+        algorithms=("apriori", "fpgrowth"),
+        min_support=params["min_support"],
+        metric=params["metric"],
+        min_threshold=params["min_threshold"],
+        epsilon=params["epsilon"],
+        delta=params["delta"],
+    )
+    report = miner.sampling_
+    if report.sampled:
+        print(f"[INFO] Mined a sample of {report.sample_size} of {report.n_transactions} receipts "
+              f"(epsilon={report.epsilon:.3f}, delta={report.delta}); "
+              f"exact: {report.exact}, full-data fallback: {report.fallback}")
+    else:
+        print(f"[INFO] Mined all {report.n_transactions} receipts exactly "
+              f"(the error bound needs a sample at least as large as the data)")
+    rules_apriori, rules_fpgrowth = rules["apriori"], rules["fpgrowth"]
 
-    if "scontrino_id" not in df.columns:
-        raise ValueError("Column 'scontrino_id' not found in dataframe!")
+    outputs = {
+        "rules_apriori": ctx.out_dir / "rules_apriori.csv",
+        "rules_fpgrowth": ctx.out_dir / "rules_fpgrowth.csv",
+        "rule_store": ctx.out_dir / "rules_apriori.npz",
+        "comparison": ctx.out_dir / "algorithm_comparison.csv",
+    }
+    rules_apriori.to_csv(outputs["rules_apriori"], index=False)
+    print(f"[INFO] Apriori done. {len(rules_apriori)} rules saved to '../results/rules_apriori.csv'.")
+    rules_fpgrowth.to_csv(outputs["rules_fpgrowth"], index=False)
+    print(f"[INFO] FP-Growth done. {len(rules_fpgrowth)} rules saved to '../results/rules_fpgrowth.csv'.")
 
-    unique_receipts = df["scontrino_id"].dropna().unique()
-    n_receipts = len(unique_receipts)
-    print(f"[INFO] Number of distinct receipts: {n_receipts}")
+    # Indexed binary copy of the rules for fast basket lookups
+    RuleStore.from_rules(rules_apriori).save(outputs["rule_store"])
 
-    # Sampling to keep runtime/memory under control
-    max_receipts = 4000        # <= puedes subirlo/bajarlo
-    min_support_rules = 0.04   # 4% de soporte mínimo
+    comparison.to_csv(outputs["comparison"], index=False)
+    for row in comparison.itertuples():
+        print(f"[INFO] {row.algorithm}: mining {row.mining_s:.3f}s, "
+              f"rules {row.rules_s:.3f}s, itemsets match: {row.itemsets_match}")
+    return outputs
 
-    if n_receipts > max_receipts:
-        rng = np.random.default_rng(42)
-        sampled_receipts = rng.choice(
-            unique_receipts, size=max_receipts, replace=False
-        )
-        df_rules = df[df["scontrino_id"].isin(sampled_receipts)]
-        print(f"[INFO] Using a sample of {max_receipts} receipts for association rules.")
-    else:
-        df_rules = df
-        print("[INFO] Using all receipts for association rules (dataset is small enough).")
 
-    print(f"[INFO] Using min_support={min_support_rules:.2f} for association rules.")
+def stratified_rules_stage(ctx: StageContext) -> dict:
+    print("[INFO] Mining association rules per month range and time slot...")
+    params = ctx.params
+    # All receipts: strata share one encoding and are mined in parallel
+    miner = AssociationRuleMiner(_dataset(ctx), level_col="liv4", id_col="scontrino_id",
+                                 sparse=True)
+    rules_strata = miner.run_stratified(min_support=params["min_support"], n_jobs=ctx.n_jobs)
 
-    print("[INFO] Mining association rules with Apriori...")
-    miner = AssociationRuleMiner(df_rules, level_col="liv4", id_col="scontrino_id")
-    rules_apriori = miner.run_apriori(
-        min_support=min_support_rules,
-        metric="lift",
-        min_threshold=1.0,
-    )
-    rules_apriori.to_csv(RESULTS_DIR / "rules_apriori.csv", index=False)
-    print(f"[INFO] Apriori done. {len(rules_apriori)} rules saved to '../results/rules_apriori.csv'.")
+    path = ctx.out_dir / "rules_stratified.csv"
+    rules_strata.to_csv(path, index=False)
+    print(f"[INFO] {len(rules_strata)} stratified rules saved to '../results/rules_stratified.csv'.")
+    return {"rules_stratified": path}
 
-    print("[INFO] Mining association rules with FP-Growth...")
-    rules_fpgrowth = miner.run_fpgrowth(
-        min_support=min_support_rules,
-        metric="lift",
-        min_threshold=1.0,
-    )
-    rules_fpgrowth.to_csv(RESULTS_DIR / "rules_fpgrowth.csv", index=False)
-    print(f"[INFO] FP-Growth done. {len(rules_fpgrowth)} rules saved to '../results/rules_fpgrowth.csv'.")
 
-    # --------------------------------------------------
+def segmentation_stage(ctx: StageContext) -> dict:
     # 4) Task 5: Customer segmentation (PCA + K-means + silhouette)
-    # --------------------------------------------------
     print("[INFO] Running customer segmentation (Task 5)...")
-    segmenter = CustomerSegmentation(df)
+    params = ctx.params
+    outputs = {
+        "model": ctx.out_dir / "segmentation_model.joblib",
+        "clusters": ctx.out_dir / "card_clusters.csv",
+        "k_selection": ctx.out_dir / "k_selection.csv",
+    }
+    # Fitted model (saved for daily update()/predict() calls)
+    segmenter = IncrementalSegmentation(outputs["model"])
 
-    # PCA + silhouette parameters (balanced for speed and quality)
-    n_components = 5 
-    ks = range(2, 8) 
-    sample_size = 2000
-    top_n_products = 200
-
-    # n_clusters=None -> automatically selected using silhouette
-    clusters = segmenter.cluster_cards(
-        n_clusters=None,
-        n_components=n_components,
-        ks=ks,
-        sample_size=sample_size,
-        top_n_products=top_n_products,
+    # n_clusters=None -> automatically selected using silhouette;
+    # the whole catalogue is used (sparse matrix)
+    clusters = segmenter.fit(
+        _dataset(ctx),
+        n_clusters=params["n_clusters"],
+        n_components=params["n_components"],
+        ks=params["ks"],
+        sample_size=params["sample_size"],
+        n_jobs=ctx.n_jobs,
     )
-    clusters.to_csv(RESULTS_DIR / "card_clusters.csv", index=False)
+    outputs["matrix"] = segmenter.matrix_path
+    clusters.to_csv(outputs["clusters"], index=False)
+    # No k sweep when n_clusters is given
+    pd.DataFrame(segmenter.k_scores_).to_csv(outputs["k_selection"], index=False)
     print(f"[INFO] Customer segmentation done. Results saved to '../results/card_clusters.csv'.")
+    return outputs
+
+
+def similarity_stage(ctx: StageContext) -> dict:
+    # Nearest-neighbour index over the card embeddings ("similar customers")
+    segmenter = IncrementalSegmentation(ctx.inputs["segmentation"]["model"])
+    path = ctx.out_dir / "card_index.npz"
+    SimilarityIndex.from_coords(segmenter.coordinates(), segmenter.card_index).save(path)
+    print("[INFO] Similar-customers index saved to '../results/card_index.npz'.")
+    return {"card_index": path}
+
+
+def build_pipeline(n_jobs: int | None = None, force: bool = False) -> Pipeline:
+    # Stage graph: load -> {merchandising, rules, stratified_rules,
+    # segmentation -> similarity}; outputs are published to figures/ and results/
+    pipeline = Pipeline(n_jobs=n_jobs, force=force)
+
+    pipeline.add(Stage(
+        "load", load_stage,
+        params={"source": str(DATA_PATH)},
+        fingerprint=_dataset_fingerprint,
+    ))
+    pipeline.add(Stage(
+        "merchandising", merchandising_stage, inputs=("load",), version=2,
+        publish={"figures": FIGURES_DIR, "frequencies": RESULTS_DIR},
+    ))
+    pipeline.add(Stage(
+        "rules", rules_stage, inputs=("load",), version=2,
+        params={"min_support": 0.04, "epsilon": 0.01, "delta": 0.05,
+                "metric": "lift", "min_threshold": 1.0},
+        publish={"rules_apriori": RESULTS_DIR, "rules_fpgrowth": RESULTS_DIR,
+                 "rule_store": RESULTS_DIR, "comparison": RESULTS_DIR},
+    ))
+    pipeline.add(Stage(
+        "stratified_rules", stratified_rules_stage, inputs=("load",),
+        params={"min_support": 0.04},
+        publish={"rules_stratified": RESULTS_DIR},
+    ))
+    # PCA + silhouette parameters (balanced for speed and quality)
+    pipeline.add(Stage(
+        "segmentation", segmentation_stage, inputs=("load",), version=2,
+        params={"n_clusters": None, "n_components": 5,
+                "ks": list(range(2, 8)), "sample_size": 2000},
+        publish={"model": RESULTS_DIR, "matrix": RESULTS_DIR, "clusters": RESULTS_DIR,
+                 "k_selection": RESULTS_DIR},
+    ))
+    pipeline.add(Stage(
+        "similarity", similarity_stage, inputs=("segmentation",), version=2,
+        publish={"card_index": RESULTS_DIR},
+    ))
+    return pipeline
+
+
+def _parse_overrides(assignments: list[str]) -> dict:
+    # ["rules.min_support=0.02", ...] -> {"rules": {"min_support": 0.02}}
+    overrides: dict = {}
+    for assignment in assignments:
+        target, sep, raw = assignment.partition("=")
+        stage, dot, param = target.partition(".")
+        if not sep or not dot:
+            raise ValueError(f"Invalid --set '{assignment}': expected STAGE.PARAM=VALUE")
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            value = raw  # plain strings need no quotes
+        overrides.setdefault(stage, {})[param] = value
+    return overrides
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description="Run the analysis stages; unchanged stages are read from cache."
+    )
+    parser.add_argument("stages", nargs="*",
+                        help="stages to run (default: all); upstream stages are added")
+    parser.add_argument("--set", dest="overrides", action="append", default=[],
+                        metavar="STAGE.PARAM=VALUE",
+                        help="override a stage parameter (JSON value), e.g. rules.min_support=0.02")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="stages run concurrently (default: number of CPUs); the CPUs are "
+                             "divided among them for the stages' own process pools")
+    parser.add_argument("--force", action="store_true", help="ignore cached artifacts and rebuild the dataset cache")
+    parser.add_argument("--list", action="store_true",
+                        help="show stages, parameters and cache status, then exit")
+    parser.add_argument("--profile", action="store_true",
+                        help="dump cProfile stats per stage to results/profiles/")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="trace Python allocations per stage (slow)")
+    args = parser.parse_args(argv)
+    profiler.configure(cprofile=args.profile, tracemalloc=args.tracemalloc,
+                       profile_dir=RESULTS_DIR / "profiles")
+
+    pipeline = build_pipeline(n_jobs=args.jobs, force=args.force)
+    try:
+        pipeline.set_params(_parse_overrides(args.overrides))
+        plan = pipeline.plan(args.stages or None)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.list:
+        for name, key, cached in plan:
+            status = "cached" if cached else "to run"
+            print(f"{name:<18} {key}  {status:<7} {pipeline.stages[name].params}")
+        return
+
+    # Create output directories if they do not exist
+    FIGURES_DIR.mkdir(parents=True, exist_ok=True)
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+
+    results = pipeline.run(args.stages or None)
+    for result in results.values():
+        status = "cached" if result.cached else f"ran in {result.seconds:.2f}s"
+        print(f"[INFO] Stage '{result.name}' ({result.key}): {status}")
+        profiler.records.extend(result.records)
+
+    # Timings, CPU time, peak RSS and input sizes of the stages that ran
+    profiler.save(RESULTS_DIR / "profile_report.json")
+    profiler.save(RESULTS_DIR / "profile_report.csv")
+    print("[INFO] Run report saved to '../results/profile_report.json' (and .csv).")
 
-    print("[INFO] Analysis completed. Check '../figures/' and '../results/'.")    
+    print("[INFO] Analysis completed. Check '../figures/' and '../results/'.")
 
 
 if __name__ == "__main__":
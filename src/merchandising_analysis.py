@@ -1,54 +1,87 @@
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Union
 import pandas as pd # type: ignore
-import matplotlib.pyplot as plt # type: ignore
 
 from config import MERCH_LEVELS # type: ignore
+from frequency_engine import FrequencyEngine, GLOBAL_DIMENSION
+from figure_renderer import BarChartJob, FigureRenderer
 
 class MerchandisingAnalyzer:
     """
     Basic merchandising frequency analysis for liv1-liv4.
     """
 
-    def __init__(self, df: pd.DataFrame, figures_dir: Path):
+    def __init__(self, df: pd.DataFrame, figures_dir: Path,
+                 renderer: Optional[FigureRenderer] = None):
         self.df = df
         self.figures_dir = figures_dir
         self.figures_dir.mkdir(parents=True, exist_ok=True)
+        # Figures are queued as jobs and drawn in parallel on flush
+        self.renderer = renderer if renderer is not None else FigureRenderer()
+        # Columns counted by frequencies(); run_task1 may add others
+        self.levels: List[str] = list(MERCH_LEVELS)
+        self._freq: Optional[pd.DataFrame] = None
+
+    def _strata(self) -> Dict[str, Union[str, pd.Series]]:
+        # Stratum dimensions counted alongside the global frequencies
+        return {}
+
+    def frequencies(self) -> pd.DataFrame:
+        """
+        Tidy frequency table (dimension, stratum, level, category, count)
+        for the global scope and every stratum dimension, computed once.
+        """
+        if self._freq is None:
+            engine = FrequencyEngine(self.df, self.levels)
+            self._freq = engine.compute(self._strata())
+        return self._freq
+
+    def save_frequencies(self, path: Path) -> Path:
+        # Write the frequency table as CSV or Parquet (by file suffix)
+        return FrequencyEngine.save(self.frequencies(), path)
 
     def _plot_top_bottom(self, series: pd.Series,
                          level_name: str,
                          suffix: str = "") -> None:
-        # Count category frequencies
+        # Count category frequencies (categorical columns also report
+        # categories absent from this subset, so drop zero counts)
         counts = series.value_counts()
+        self._plot_counts(counts[counts > 0], level_name, suffix)
 
+    def _plot_counts(self, counts: pd.Series,
+                     level_name: str,
+                     suffix: str = "") -> None:
+        # counts: category frequencies sorted in decreasing order
         if counts.empty:
             return
 
         top5 = counts.head(5)
         bottom5 = counts.tail(5)
 
-        # Top 5
-        plt.figure()
-        top5.plot(kind="bar")
-        plt.title(f"Top 5 {level_name} {suffix}")
-        plt.ylabel("Frequency")
-        plt.tight_layout()
-        plt.savefig(self.figures_dir / f"{level_name}_top5{suffix}.png")
-        plt.close()
-
-        # Bottom 5
-        plt.figure()
-        bottom5.plot(kind="bar")
-        plt.title(f"Bottom 5 {level_name} {suffix}")
-        plt.ylabel("Frequency")
-        plt.tight_layout()
-        plt.savefig(self.figures_dir / f"{level_name}_bottom5{suffix}.png")
-        plt.close()
+        for kind, sel in (("Top", top5), ("Bottom", bottom5)):
+            self.renderer.submit(BarChartJob(
+                path=self.figures_dir / f"{level_name}_{kind.lower()}5{suffix}.png",
+                title=f"{kind} 5 {level_name} {suffix}",
+                labels=[str(c) for c in sel.index],
+                values=[float(v) for v in sel.to_numpy()],
+                xlabel=str(level_name),
+            ))
 
     def run_task1(self, levels: List[str] = None) -> None:
         if levels is None:
             levels = MERCH_LEVELS
+        levels = [level for level in levels if level in self.df.columns]
+
+        # Columns other than liv1-liv4 are added to the frequency table
+        # (recomputed once, still in a single pass)
+        extra = [level for level in levels if level not in self.levels]
+        if extra:
+            self.levels = self.levels + extra
+            self._freq = None
 
+        freq = self.frequencies()
         for level in levels:
-            if level in self.df.columns:
-                self._plot_top_bottom(self.df[level], level)
+            counts = FrequencyEngine.counts_for(freq, GLOBAL_DIMENSION,
+                                                GLOBAL_DIMENSION, level)
+            self._plot_counts(counts, level)
+        self.renderer.flush()
@@ -0,0 +1,303 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from profiling import profiler
+from config import CACHE_DIR # type: ignore
+
+PIPELINE_CACHE_DIR = CACHE_DIR / "pipeline"
+
+
+@dataclass
+class StageContext:
+    """
+    What a stage function receives: its parameters, the outputs of its
+    upstream stages ({stage: {output: path}}) and the directory to
+    write its own outputs to. force is set when the pipeline runs with
+    force=True, so a stage also rebuilds caches of its own. n_jobs is
+    the number of cores the stage may use for its own process pools
+    (the CPUs divided among the stages that can run at once).
+    """
+    params: Dict
+    inputs: Dict[str, Dict[str, Path]]
+    out_dir: Path
+    force: bool = False
+    n_jobs: int = 1
+
+
+@dataclass
+class Stage:
+    """
+    One node of the pipeline. func(ctx) writes its outputs and returns
+    them as {name: path}; bump version when func changes. fingerprint
+    (params -> str) adds external state to the key, e.g. a source file.
+    Outputs listed in publish ({output: directory}) are copied there
+    after every run, cached or not.
+    """
+    name: str
+    func: Callable[[StageContext], Dict[str, Path]]
+    inputs: Tuple[str, ...] = ()
+    params: Dict = field(default_factory=dict)
+    version: int = 1
+    fingerprint: Optional[Callable[[Dict], str]] = None
+    publish: Dict[str, Path] = field(default_factory=dict)
+
+
+@dataclass
+class StageResult:
+    name: str
+    key: str
+    outputs: Dict[str, Path]
+    cached: bool
+    seconds: float
+    records: List[Dict] = field(default_factory=list)  # profiler records
+
+
+def _coerce(name: str, param: str, default, value):
+    # Check an override against the type of the default value (None
+    # defaults accept anything); ints are accepted for float parameters
+    # and scalars for string parameters
+    if default is None:
+        return value
+    if isinstance(default, bool):
+        ok = isinstance(value, bool)
+    elif isinstance(default, float):
+        ok = isinstance(value, (int, float)) and not isinstance(value, bool)
+        value = float(value) if ok else value
+    elif isinstance(default, int):
+        ok = isinstance(value, int) and not isinstance(value, bool)
+    elif isinstance(default, str):
+        ok = isinstance(value, (str, int, float)) and not isinstance(value, bool)
+        value = str(value) if ok else value
+    else:
+        ok = isinstance(value, type(default))
+    if not ok:
+        raise ValueError(f"Invalid value {value!r} for {name}.{param}: "
+                         f"expected {type(default).__name__} like {default!r}")
+    return value
+
+
+def _run_stage(
+    name: str,
+    func: Callable,
+    ctx: StageContext,
+    profiler_options: Dict,
+) -> Tuple[Dict[str, Path], float, List[Dict]]:
+    # Worker: run and profile one stage (records go back to the parent)
+    profiler.configure(**profiler_options)
+    profiler.reset()
+    start = perf_counter()
+    with profiler.stage(f"stage.{name}"):
+        outputs = func(ctx)
+    return outputs, perf_counter() - start, list(profiler.records)
+
+
+class Pipeline:
+    """
+    DAG of analysis stages with content-addressed artifact caching.
+
+    The key of a stage is a hash of its name, version and parameters
+    and of the keys of its upstream stages, so changing a parameter
+    invalidates that stage and everything downstream of it, and nothing
+    else. Artifacts live in cache_dir/<stage>-<key>/ together with a
+    manifest.json written last; a stage whose manifest and outputs exist
+    is not run again. Stages whose inputs are ready run concurrently in
+    a process pool; each stage is profiled in its worker (see
+    profiling.py) and the records are returned with its StageResult.
+    Only the `keep` most recent artifact directories of each stage are
+    kept (the current one always is).
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path = PIPELINE_CACHE_DIR,
+        n_jobs: Optional[int] = None,
+        force: bool = False,
+        keep: int = 3,
+    ):
+        self.cache_dir = cache_dir
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        # Cores for the process pools inside one stage
+        self.stage_jobs = max(1, (os.cpu_count() or 1) // self.n_jobs)
+        self.force = force
+        self.keep = keep
+        self.stages: Dict[str, Stage] = {}
+
+    def add(self, stage: Stage) -> Stage:
+        missing = [s for s in stage.inputs if s not in self.stages]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {missing}")
+        self.stages[stage.name] = stage
+        return stage
+
+    def set_params(self, overrides: Dict[str, Dict]) -> None:
+        # {stage: {param: value}}, e.g. parsed from the command line
+        for name, params in overrides.items():
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage '{name}'. Choose one of: {', '.join(self.stages)}")
+            unknown = set(params) - set(self.stages[name].params)
+            if unknown:
+                raise ValueError(f"Unknown parameters for stage '{name}': {sorted(unknown)}")
+            defaults = self.stages[name].params
+            self.stages[name].params.update({
+                param: _coerce(name, param, defaults[param], value)
+                for param, value in params.items()
+            })
+
+    # ------------------------------------------------------------------
+    # Graph and keys
+    # ------------------------------------------------------------------
+    def _closure(self, targets: Iterable[str]) -> List[str]:
+        # Targets and all their upstream stages, in topological order
+        order: List[str] = []
+
+        def visit(name: str) -> None:
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage '{name}'. Choose one of: {', '.join(self.stages)}")
+            if name in order:
+                return
+            for upstream in self.stages[name].inputs:
+                visit(upstream)
+            order.append(name)
+
+        for name in targets:
+            visit(name)
+        return order
+
+    def _key(self, stage: Stage, upstream_keys: Dict[str, str]) -> str:
+        payload = {
+            "stage": stage.name,
+            "version": stage.version,
+            "params": stage.params,
+            "inputs": {s: upstream_keys[s] for s in stage.inputs},
+            "fingerprint": stage.fingerprint(stage.params) if stage.fingerprint else None,
+        }
+        blob = json.dumps(payload, sort_keys=True, default=str).encode()
+        return hashlib.sha256(blob).hexdigest()[:16]
+
+    def _artifact_dir(self, name: str, key: str) -> Path:
+        return self.cache_dir / f"{name}-{key}"
+
+    def _cached_outputs(self, name: str, key: str) -> Optional[Dict[str, Path]]:
+        manifest = self._artifact_dir(name, key) / "manifest.json"
+        if self.force or not manifest.exists():
+            return None
+        with open(manifest, encoding="utf-8") as f:
+            outputs = {k: Path(v) for k, v in json.load(f)["outputs"].items()}
+        return outputs if all(p.exists() for p in outputs.values()) else None
+
+    def _write_manifest(self, stage: Stage, key: str, outputs: Dict[str, Path],
+                        seconds: float) -> None:
+        manifest = {
+            "stage": stage.name,
+            "key": key,
+            "params": stage.params,
+            "inputs": list(stage.inputs),
+            "outputs": {k: str(v) for k, v in outputs.items()},
+            "seconds": seconds,
+        }
+        path = self._artifact_dir(stage.name, key) / "manifest.json"
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, default=str)
+        tmp.replace(path)
+
+    def _evict(self, name: str, key: str) -> None:
+        # Drop all but the `keep` most recent artifact dirs of the stage
+        pattern = re.compile(rf"{re.escape(name)}-[0-9a-f]{{16}}")
+        dirs = [d for d in self.cache_dir.glob(f"{name}-*")
+                if pattern.fullmatch(d.name) and (d / "manifest.json").exists()
+                and d != self._artifact_dir(name, key)]
+        dirs.sort(key=lambda d: (d / "manifest.json").stat().st_mtime, reverse=True)
+        for old in dirs[max(self.keep - 1, 0):]:
+            shutil.rmtree(old, ignore_errors=True)
+
+    @staticmethod
+    def _publish(stage: Stage, outputs: Dict[str, Path]) -> None:
+        # Copy published outputs (files, or the files of a directory)
+        for output, publish_dir in stage.publish.items():
+            path = outputs[output]
+            publish_dir.mkdir(parents=True, exist_ok=True)
+            files = sorted(p for p in path.iterdir() if p.is_file()) if path.is_dir() else [path]
+            for src in files:
+                dst = publish_dir / src.name
+                if dst.resolve() != src.resolve():
+                    shutil.copy2(src, dst)
+
+    # ------------------------------------------------------------------
+    # Execution
+    # ------------------------------------------------------------------
+    def plan(self, targets: Optional[Iterable[str]] = None) -> List[Tuple[str, str, bool]]:
+        # (stage, key, cached) for each stage that a run would touch
+        names = self._closure(targets or self.stages)
+        keys: Dict[str, str] = {}
+        plan = []
+        for name in names:
+            keys[name] = self._key(self.stages[name], keys)
+            plan.append((name, keys[name], self._cached_outputs(name, keys[name]) is not None))
+        return plan
+
+    def run(self, targets: Optional[Iterable[str]] = None) -> Dict[str, StageResult]:
+        """
+        Run the target stages (default: all) and their upstream stages,
+        reusing cached artifacts. Returns one StageResult per stage.
+        """
+        plan = self.plan(targets)
+        keys = {name: key for name, key, _ in plan}
+        results: Dict[str, StageResult] = {}
+        pending = [name for name, _, _ in plan]
+
+        def finish(name: str, outputs: Dict[str, Path], cached: bool, seconds: float,
+                   records: List[Dict]) -> None:
+            stage = self.stages[name]
+            if not cached:
+                self._write_manifest(stage, keys[name], outputs, seconds)
+            self._publish(stage, outputs)
+            self._evict(name, keys[name])
+            results[name] = StageResult(name, keys[name], outputs, cached, seconds, records)
+
+        with ProcessPoolExecutor(max_workers=self.n_jobs) as pool:
+            running = {}
+            while pending or running:
+                # Start every stage whose inputs are done
+                for name in list(pending):
+                    stage = self.stages[name]
+                    if not all(s in results for s in stage.inputs):
+                        continue
+                    pending.remove(name)
+
+                    cached = self._cached_outputs(name, keys[name])
+                    if cached is not None:
+                        finish(name, cached, True, 0.0, [])
+                        continue
+
+                    out_dir = self._artifact_dir(name, keys[name])
+                    # Leftovers of an interrupted run are discarded
+                    shutil.rmtree(out_dir, ignore_errors=True)
+                    out_dir.mkdir(parents=True)
+                    ctx = StageContext(
+                        params=dict(stage.params),
+                        inputs={s: results[s].outputs for s in stage.inputs},
+                        out_dir=out_dir,
+                        force=self.force,
+                        n_jobs=self.stage_jobs,
+                    )
+                    running[pool.submit(_run_stage, name, stage.func, ctx,
+                                        profiler.options())] = name
+
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    outputs, seconds, records = future.result()
+                    finish(name, outputs, False, seconds, records)
+
+        return results
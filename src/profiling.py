@@ -0,0 +1,228 @@
+import cProfile
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Deque, Dict, Iterator, List, Optional
+
+import numpy as np # type: ignore
+import pandas as pd # type: ignore
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+_PROC_STATUS = Path("/proc/self/status")
+_CLEAR_REFS = Path("/proc/self/clear_refs")
+
+
+def _peak_rss_mb() -> Optional[float]:
+    # Peak resident set size (VmHWM on Linux, ru_maxrss elsewhere)
+    if _PROC_STATUS.exists():
+        with open(_PROC_STATUS) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    return None
+
+
+def _reset_peak_rss() -> None:
+    # Linux only: restart VmHWM from the current RSS; elsewhere the peak
+    # stays the process-wide peak
+    try:
+        with open(_CLEAR_REFS, "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def describe(obj) -> Dict:
+    """
+    Size summary of a stage input: rows/columns/bytes for DataFrames and
+    arrays, shape/nnz for sparse matrices, len for other sized objects.
+    """
+    if isinstance(obj, pd.DataFrame):
+        return {"rows": obj.shape[0], "cols": obj.shape[1],
+                "mb": round(obj.memory_usage(deep=False).sum() / 2**20, 3)}
+    if isinstance(obj, np.ndarray):
+        return {"shape": list(obj.shape), "mb": round(obj.nbytes / 2**20, 3)}
+    if hasattr(obj, "nnz"):
+        return {"shape": list(obj.shape), "nnz": int(obj.nnz)}
+    if hasattr(obj, "__len__"):
+        return {"len": len(obj)}
+    return {}
+
+
+class StageProfiler:
+    """
+    Per-stage timing and memory instrumentation.
+
+    Every stage (context manager or decorated function) records wall
+    time, CPU time, peak RSS during the stage and the input sizes given
+    by the caller. Stages can be nested; a parent's peak includes its
+    children's. Optionally, the outermost profiled stage dumps cProfile
+    stats and every stage reports its tracemalloc peak (slow). Records
+    are exported as a JSON or CSV run report. Only the last max_records
+    records are kept, so long-lived processes do not grow without bound.
+    """
+
+    def __init__(self, max_records: int = 10_000):
+        self.records: Deque[Dict] = deque(maxlen=max_records)
+        self.cprofile = False
+        self.tracemalloc = False
+        self.profile_dir: Optional[Path] = None
+        self._stack: List[Dict] = []
+        self._profiling = False
+
+    def configure(
+        self,
+        cprofile: bool = False,
+        tracemalloc: bool = False,
+        profile_dir: Optional[Path] = None,
+    ) -> None:
+        if (cprofile or tracemalloc) and profile_dir is None:
+            raise ValueError("profile_dir is required for cProfile/tracemalloc dumps")
+        self.cprofile = cprofile
+        self.tracemalloc = tracemalloc
+        self.profile_dir = Path(profile_dir) if profile_dir is not None else None
+
+    def options(self) -> Dict:
+        # Settings to replay with configure() in a worker process
+        return {"cprofile": self.cprofile, "tracemalloc": self.tracemalloc,
+                "profile_dir": self.profile_dir}
+
+    def reset(self) -> None:
+        self.records.clear()
+
+    def _dump_path(self, name: str, suffix: str) -> Path:
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        return self.profile_dir / f"{os.getpid()}-{len(self.records):03d}-{name}{suffix}"
+
+    @contextmanager
+    def stage(self, name: str, **sizes) -> Iterator[Dict]:
+        """
+        Profile the enclosed block. The yielded record can be updated
+        inside the block, e.g. record["sizes"]["rules"] = len(rules).
+        """
+        parent = self._stack[-1] if self._stack else None
+        record = {
+            "stage": name,
+            "parent": parent["stage"] if parent else None,
+            "depth": len(self._stack),
+            "pid": os.getpid(),
+            "sizes": sizes,
+        }
+        # Peaks are reset at the start of every stage, so the parent first
+        # gets the peak it reached so far; children report theirs on exit
+        if parent is not None:
+            self._push_peaks(parent, _peak_rss_mb(),
+                             tracemalloc.get_traced_memory()[1] / 2**20
+                             if tracemalloc.is_tracing() else None)
+        child_peaks = {"rss": None, "traced": None}
+        record["_child_peaks"] = child_peaks
+        self._stack.append(record)
+
+        cprof = None
+        if self.cprofile and not self._profiling:
+            cprof = cProfile.Profile()
+            self._profiling = True
+        started_tracing = False
+        if self.tracemalloc:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+
+        _reset_peak_rss()
+        wall, cpu = time.perf_counter(), time.process_time()
+        if cprof is not None:
+            cprof.enable()
+        try:
+            yield record
+        finally:
+            if cprof is not None:
+                cprof.disable()
+                self._profiling = False
+            record["wall_s"] = time.perf_counter() - wall
+            record["cpu_s"] = time.process_time() - cpu
+
+            record.pop("_child_peaks")
+            peaks = [p for p in (_peak_rss_mb(), child_peaks["rss"]) if p is not None]
+            record["peak_rss_mb"] = round(max(peaks), 1) if peaks else None
+
+            if self.tracemalloc:
+                traced = tracemalloc.get_traced_memory()[1] / 2**20
+                record["tracemalloc_peak_mb"] = round(max(traced, child_peaks["traced"] or 0.0), 3)
+                if started_tracing:
+                    snapshot = tracemalloc.take_snapshot()
+                    tracemalloc.stop()
+                    with open(self._dump_path(name, ".tracemalloc.txt"), "w") as f:
+                        for stat in snapshot.statistics("lineno")[:25]:
+                            f.write(f"{stat}\n")
+            if cprof is not None:
+                cprof.dump_stats(self._dump_path(name, ".prof"))
+
+            self._stack.pop()
+            if parent is not None:
+                self._push_peaks(parent, record["peak_rss_mb"],
+                                 record.get("tracemalloc_peak_mb"))
+            self.records.append(record)
+
+    @staticmethod
+    def _push_peaks(record: Dict, rss: Optional[float], traced: Optional[float]) -> None:
+        # Raise the peaks a stage will report to at least rss / traced
+        peaks = record["_child_peaks"]
+        for key, value in (("rss", rss), ("traced", traced)):
+            if value is not None:
+                peaks[key] = max(peaks[key] or 0.0, value)
+
+    def __call__(
+        self,
+        name: Optional[str] = None,
+        sizes: Optional[Callable[..., Dict]] = None,
+    ) -> Callable:
+        """
+        Decorator form: @profiler("stage") or @profiler(sizes=fn), where
+        fn receives the call arguments and returns the input sizes.
+        """
+        def decorator(func: Callable) -> Callable:
+            stage_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                stage_sizes = sizes(*args, **kwargs) if sizes is not None else {}
+                with self.stage(stage_name, **stage_sizes):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def report(self) -> pd.DataFrame:
+        columns = ["stage", "parent", "depth", "pid", "wall_s", "cpu_s",
+                   "peak_rss_mb", "tracemalloc_peak_mb", "sizes"]
+        return pd.DataFrame(list(self.records), columns=columns)
+
+    def save(self, path: Path) -> Path:
+        # JSON (full records) or CSV (sizes as JSON text), by file suffix
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix == ".csv":
+            report = self.report()
+            report["sizes"] = report["sizes"].map(lambda s: json.dumps(s, default=str))
+            report.to_csv(path, index=False)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"records": list(self.records)}, f, indent=2, default=str)
+        return path
+
+
+# Process-wide profiler used by the instrumented modules
+profiler = StageProfiler()
@@ -0,0 +1,111 @@
+import heapq
+from itertools import count
+from typing import Dict, FrozenSet, Iterator, List, Optional
+
+import numpy as np # type: ignore
+import pandas as pd # type: ignore
+
+RULE_METRICS = [
+    "antecedent support", "consequent support", "support",
+    "confidence", "lift", "leverage", "conviction",
+]
+
+
+def _next_consequents(passed: List[FrozenSet]) -> List[FrozenSet]:
+    # Apriori-gen on consequents: size k+1 sets whose k-subsets all passed
+    passed_set = set(passed)
+    out = set()
+    for i, a in enumerate(passed):
+        for b in passed[i + 1:]:
+            cand = a | b
+            if len(cand) == len(a) + 1 and cand not in out and all(
+                (cand - {x}) in passed_set for x in cand
+            ):
+                out.add(cand)
+    return list(out)
+
+
+def iter_rules(
+    freq_items: pd.DataFrame,
+    min_confidence: float = 0.0,
+    metric: str = "lift",
+    min_threshold: float = 1.0,
+) -> Iterator[Dict]:
+    """
+    Stream association rules from a frequent itemset table (mlxtend
+    schema: support, itemsets) without materializing them all.
+
+    Supports are looked up in a hash table keyed by itemset. For each
+    itemset, consequents grow level-wise and a consequent is only
+    extended if its rule reached min_confidence: moving items from the
+    antecedent to the consequent can only lower the confidence, so the
+    pruned branches contain no valid rule. Rules are yielded when
+    rule[metric] >= min_threshold.
+    """
+    if metric not in RULE_METRICS:
+        raise ValueError(f"Unknown metric '{metric}'. Choose one of: {', '.join(RULE_METRICS)}")
+
+    support = dict(zip(freq_items["itemsets"], freq_items["support"]))
+
+    for itemset, s_xy in support.items():
+        if len(itemset) < 2:
+            continue
+
+        consequents = [frozenset([i]) for i in itemset]
+        while consequents:
+            passed = []
+            for cons in consequents:
+                ante = itemset - cons
+                if not ante:
+                    continue
+                s_x = support[ante]
+                confidence = s_xy / s_x
+                if confidence < min_confidence:
+                    continue
+                passed.append(cons)
+
+                s_y = support[cons]
+                rule = {
+                    "antecedents": ante,
+                    "consequents": cons,
+                    "antecedent support": s_x,
+                    "consequent support": s_y,
+                    "support": s_xy,
+                    "confidence": confidence,
+                    "lift": confidence / s_y,
+                    "leverage": s_xy - s_x * s_y,
+                    "conviction": (np.inf if confidence >= 1.0
+                                   else (1.0 - s_y) / (1.0 - confidence)),
+                }
+                if rule[metric] >= min_threshold:
+                    yield rule
+            consequents = _next_consequents(passed)
+
+
+def top_k_rules(
+    freq_items: pd.DataFrame,
+    k: int,
+    metric: str = "lift",
+    min_threshold: float = 1.0,
+    min_confidence: float = 0.0,
+    rank_by: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Best k rules by rank_by (default: metric), keeping only a bounded
+    heap of k rules in memory while streaming from iter_rules().
+    """
+    if k < 1:
+        raise ValueError(f"k must be at least 1, got {k}")
+    rank_by = rank_by or metric
+    heap: list = []
+    tie = count()  # avoids comparing dicts on equal scores
+
+    for rule in iter_rules(freq_items, min_confidence, metric, min_threshold):
+        entry = (rule[rank_by], next(tie), rule)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry[0] > heap[0][0]:
+            heapq.heapreplace(heap, entry)
+
+    rows = [rule for _, _, rule in sorted(heap, key=lambda e: e[0], reverse=True)]
+    return pd.DataFrame(rows, columns=["antecedents", "consequents"] + RULE_METRICS)
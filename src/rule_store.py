@@ -0,0 +1,160 @@
+import heapq
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np # type: ignore
+import pandas as pd # type: ignore
+
+from labels import normalize_labels, label_key
+
+
+def _csr(lists: List[List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+    # Ragged integer lists -> (pointer, values) arrays
+    ptr = np.zeros(len(lists) + 1, dtype=np.int64)
+    ptr[1:] = np.cumsum([len(l) for l in lists])
+    values = np.fromiter((v for l in lists for v in l), dtype=np.int32, count=int(ptr[-1]))
+    return ptr, values
+
+
+class RuleStore:
+    """
+    Compact, indexed store of association rules for basket
+    recommendations.
+
+    Items are integer-coded; antecedents and consequents are stored as
+    CSR-style (pointer, codes) arrays together with the rule metrics,
+    plus an inverted index item -> rules having that item in the
+    antecedent. The store is saved as a single uncompressed .npz file.
+
+    For queries, each posting list is kept sorted by the ranking metric,
+    so recommend() merges the lists of the basket items lazily and stops
+    as soon as k items are found.
+    """
+
+    METRICS = ("support", "confidence", "lift")
+
+    def __init__(self, items: np.ndarray, arrays: Dict[str, np.ndarray]):
+        self.items = items
+        self.arrays = arrays
+        self._labels = items.tolist()
+        self._code = {item: i for i, item in enumerate(self._labels)}
+        self._integer = np.issubdtype(items.dtype, np.integer)
+
+        # Plain Python views of the rules: faster than NumPy for the
+        # handful of rules touched by a single query
+        ante_ptr, cons_ptr = arrays["ante_ptr"], arrays["cons_ptr"]
+        ante_items, cons_items = arrays["ante_items"], arrays["cons_items"]
+        self._ante = [frozenset(ante_items[ante_ptr[r]:ante_ptr[r + 1]].tolist())
+                      for r in range(len(ante_ptr) - 1)]
+        self._cons = [tuple(cons_items[cons_ptr[r]:cons_ptr[r + 1]].tolist())
+                      for r in range(len(cons_ptr) - 1)]
+        self._postings: Dict[str, List[List[Tuple[float, int]]]] = {}
+
+    @classmethod
+    def from_rules(cls, rules: pd.DataFrame) -> "RuleStore":
+        """
+        Build the store from the output of AssociationRuleMiner
+        (frozenset antecedents/consequents plus metric columns).
+        """
+        if rules.empty:
+            labels = []
+        else:
+            labels = sorted(
+                set().union(*rules["antecedents"], *rules["consequents"]),
+                key=lambda x: (str(type(x)), x),
+            )
+
+        # Integral labels (also liv4 codes read as floats) are stored as
+        # int64, anything else as text; recommend() maps queries the same way
+        items = (normalize_labels(np.asarray(labels, dtype=object)) if labels
+                 else np.asarray([], dtype=np.int64))
+        code = {label: i for i, label in enumerate(labels)}
+
+        antecedents = [[code[i] for i in a] for a in rules.get("antecedents", [])]
+        consequents = [[code[i] for i in c] for c in rules.get("consequents", [])]
+        ante_ptr, ante_items = _csr(antecedents)
+        cons_ptr, cons_items = _csr(consequents)
+
+        # Inverted index: item -> rules with the item in the antecedent
+        postings: List[List[int]] = [[] for _ in labels]
+        for rule_id, ante in enumerate(antecedents):
+            for item in ante:
+                postings[item].append(rule_id)
+        index_ptr, index_rules = _csr(postings)
+
+        arrays = {
+            "ante_ptr": ante_ptr, "ante_items": ante_items,
+            "cons_ptr": cons_ptr, "cons_items": cons_items,
+            "index_ptr": index_ptr, "index_rules": index_rules,
+        }
+        for metric in cls.METRICS:
+            values = rules[metric] if metric in rules else []
+            arrays[metric] = np.asarray(values, dtype=np.float32)
+        return cls(items, arrays)
+
+    def __len__(self) -> int:
+        return len(self._ante)
+
+    def save(self, path: Path) -> Path:
+        np.savez(path, items=self.items, **self.arrays)
+        return path
+
+    @classmethod
+    def load(cls, path: Path) -> "RuleStore":
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {k: data[k] for k in data.files if k != "items"}
+            items = data["items"]
+        return cls(items, arrays)
+
+    def _sorted_postings(self, by: str) -> List[List[Tuple[float, int]]]:
+        # Per item: (-score, rule id) of the rules it appears in as
+        # antecedent, best score first (built once per metric)
+        if by not in self._postings:
+            scores = self.arrays[by]
+            ptr, rules = self.arrays["index_ptr"], self.arrays["index_rules"]
+            lists = []
+            for c in range(len(self._labels)):
+                rs = rules[ptr[c]:ptr[c + 1]]
+                rs = rs[np.argsort(-scores[rs], kind="stable")]
+                lists.append(list(zip((-scores[rs]).tolist(), rs.tolist())))
+            self._postings[by] = lists
+        return self._postings[by]
+
+    def recommend(
+        self,
+        basket: Iterable,
+        k: int = 5,
+        by: str = "lift",
+    ) -> List[Tuple[object, float]]:
+        """
+        Top-k consequent items for a basket of (liv4) items, as
+        (item, score) pairs. A rule fires when its whole antecedent is
+        in the basket; each item gets the best score (by metric) of the
+        rules recommending it. Items already in the basket are skipped.
+        Basket items are matched like the stored labels (1001011,
+        1001011.0 and "1001011" are the same integer item).
+        """
+        if by not in self.METRICS:
+            raise ValueError(f"Unknown metric '{by}'. Choose one of: {', '.join(self.METRICS)}")
+
+        keys = (label_key(i, self._integer) for i in basket)
+        codes = {self._code[key] for key in keys if key in self._code}
+        if not codes:
+            return []
+
+        postings = self._sorted_postings(by)
+        seen = set(codes)
+        found: List[Tuple[int, float]] = []
+
+        # Rules in decreasing score order across all basket items
+        for neg_score, r in heapq.merge(*(postings[c] for c in codes)):
+            if not self._ante[r] <= codes:
+                continue
+            for item in self._cons[r]:
+                if item not in seen:
+                    seen.add(item)
+                    found.append((item, -neg_score))
+            if len(found) >= k:
+                break
+
+        return [(self._labels[i], s) for i, s in found[:k]]
@@ -0,0 +1,142 @@
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np # type: ignore
+from sklearn.cluster import MiniBatchKMeans # type: ignore
+
+from labels import normalize_labels, label_key
+
+
+class SimilarityIndex:
+    """
+    Inverted-file (IVF) nearest-neighbour index over card embeddings
+    (the PCA / TruncatedSVD coordinates of the segmentation).
+
+    Cards are assigned to the nearest of n_lists coarse centroids and
+    stored grouped by list, as CSR-style (pointer, coords) arrays. A
+    query only scans the n_probe lists whose centroids are closest to
+    the query point, so its cost does not grow with the number of
+    cards. The index is saved as a single uncompressed .npz file.
+    """
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        list_ptr: np.ndarray,
+        coords: np.ndarray,
+        cards: np.ndarray,
+    ):
+        self.centroids = centroids
+        self.list_ptr = list_ptr
+        self.coords = coords    # grouped by list
+        self.cards = cards      # card label of each row of coords
+
+        self._labels = cards.tolist()
+        self._position = {card: i for i, card in enumerate(self._labels)}
+        self._sq_norms = np.einsum("ij,ij->i", coords, coords)
+        self._centroid_sq_norms = np.einsum("ij,ij->i", centroids, centroids)
+
+    @classmethod
+    def from_coords(
+        cls,
+        coords: np.ndarray,
+        cards,
+        centroids: Optional[np.ndarray] = None,
+        n_lists: Optional[int] = None,
+        random_state: int = 42,
+    ) -> "SimilarityIndex":
+        """
+        Build the index from the card coordinates and their labels.
+        centroids can be given (e.g. the KMeans cluster centers);
+        otherwise n_lists coarse centroids (default about 4 * sqrt(n))
+        are fitted with MiniBatchKMeans.
+        """
+        coords = np.ascontiguousarray(coords, dtype=np.float32)
+        n = coords.shape[0]
+
+        if centroids is None:
+            n_lists = n_lists or max(1, int(4 * np.sqrt(n)))
+            n_lists = min(n_lists, n)
+            km = MiniBatchKMeans(n_clusters=n_lists, random_state=random_state,
+                                 batch_size=4096, n_init=1)
+            centroids = km.fit(coords).cluster_centers_
+        centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+
+        # Nearest centroid of every card, then group the cards by list
+        dist = (np.einsum("ij,ij->i", centroids, centroids)[None, :]
+                - 2.0 * coords @ centroids.T)
+        lists = dist.argmin(axis=1)
+        order = np.argsort(lists, kind="stable")
+        list_ptr = np.zeros(len(centroids) + 1, dtype=np.int64)
+        list_ptr[1:] = np.cumsum(np.bincount(lists, minlength=len(centroids)))
+
+        return cls(centroids, list_ptr, coords[order], normalize_labels(cards)[order])
+
+    def __len__(self) -> int:
+        return len(self._labels)
+
+    def save(self, path: Path) -> Path:
+        np.savez(path, centroids=self.centroids, list_ptr=self.list_ptr,
+                 coords=self.coords, cards=self.cards)
+        return path
+
+    @classmethod
+    def load(cls, path: Path) -> "SimilarityIndex":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["centroids"], data["list_ptr"], data["coords"], data["cards"])
+
+    def query(
+        self,
+        point: np.ndarray,
+        k: int = 10,
+        n_probe: int = 8,
+        exclude: Optional[int] = None,
+    ) -> List[Tuple[object, float]]:
+        """
+        Approximate k nearest cards to a point of the embedding space,
+        as (card, euclidean distance) pairs. exclude is a row position
+        to skip (the query card itself).
+        """
+        point = np.asarray(point, dtype=np.float32)
+
+        # n_probe closest lists
+        n_probe = min(n_probe, len(self.centroids))
+        centroid_dist = self._centroid_sq_norms - 2.0 * (self.centroids @ point)
+        probe = np.argpartition(centroid_dist, n_probe - 1)[:n_probe]
+
+        # Candidate rows: contiguous slices of the probed lists
+        ptr = self.list_ptr
+        rows = np.concatenate([np.arange(ptr[c], ptr[c + 1]) for c in probe])
+        if exclude is not None:
+            rows = rows[rows != exclude]
+        if len(rows) == 0:
+            return []
+
+        sq_dist = self._sq_norms[rows] - 2.0 * (self.coords[rows] @ point) + point @ point
+        k = min(k, len(rows))
+        best = np.argpartition(sq_dist, k - 1)[:k]
+        best = best[np.argsort(sq_dist[best], kind="stable")]
+
+        distances = np.sqrt(np.maximum(sq_dist[best], 0.0)).tolist()
+        return [(self._labels[r], d) for r, d in zip(rows[best].tolist(), distances)]
+
+    def _lookup(self, card) -> int:
+        # Row of a card, accepting 1057, 1057.0 or "1057" for integer ids
+        key = label_key(card, np.issubdtype(self.cards.dtype, np.integer))
+        position = self._position.get(key)
+        if position is None:
+            raise KeyError(f"Unknown card: {card!r}")
+        return position
+
+    def similar_cards(
+        self,
+        card,
+        k: int = 10,
+        n_probe: int = 8,
+    ) -> List[Tuple[object, float]]:
+        """
+        The k cards most similar to a given card (tessera id), nearest
+        first. Raises KeyError for cards that are not in the index.
+        """
+        position = self._lookup(card)
+        return self.query(self.coords[position], k=k, n_probe=n_probe, exclude=position)
@@ -0,0 +1,29 @@
+import numpy as np # type: ignore
+import pandas as pd # type: ignore
+
+# Stratum definitions (Task 2), shared by the merchandising analysis and
+# stratified rule mining (no plotting or loading dependencies)
+MONTH_RANGES = ["R1_Jan_midMay", "R2_midMay_Sep", "R3_Oct_Dec"]
+TIME_SLOT_BINS = [0, 8 * 60 + 30, 12 * 60 + 30, 16 * 60 + 30, 20 * 60 + 30, 24 * 60]
+TIME_SLOTS = ["before_8_30", "S1_08_30_12_30", "S2_12_30_16_30",
+              "S3_16_30_20_30", "after_20_30"]
+VALID_SLOTS = ["S1_08_30_12_30", "S2_12_30_16_30", "S3_16_30_20_30"]
+
+
+def month_range(month: np.ndarray, day: np.ndarray) -> pd.Categorical:
+    # R1: Jan - May 15, R2: May 16 - Sep, R3: Oct - Dec
+    month = np.asarray(month)
+    day = np.asarray(day)
+
+    cond1 = (month < 5) | ((month == 5) & (day <= 15))
+    cond2 = ((month == 5) & (day > 15)) | ((month > 5) & (month <= 9))
+    cond3 = month >= 10
+
+    codes = np.select([cond1, cond2, cond3], [0, 1, 2], default=-1)
+    return pd.Categorical.from_codes(codes, categories=MONTH_RANGES)
+
+
+def time_slot(minute_of_day: pd.Series) -> pd.Series:
+    # Slots by minute of day; only S1/S2/S3 (VALID_SLOTS) are analysed
+    return pd.cut(minute_of_day, bins=TIME_SLOT_BINS, labels=TIME_SLOTS,
+                  right=False, include_lowest=True)
@@ -1,63 +1,102 @@
 from pathlib import Path
+from typing import Dict, Optional, Union
 import pandas as pd # type: ignore
-import numpy as np # type: ignore
 
 from merchandising_analysis import MerchandisingAnalyzer
-from config import DATE_COL, TIME_COL, MERCH_LEVELS # type: ignore
+from frequency_engine import FrequencyEngine
+from figure_renderer import FigureRenderer
+from data_loader import DataLoader
+from strata import month_range, time_slot, VALID_SLOTS
+from config import ( # type: ignore
+    DATE_COL, TIME_COL, MERCH_LEVELS,
+    DATETIME_COL, MINUTE_COL, MONTH_COL, DAY_COL,
+)
 
 class StratifiedAnalyzer(MerchandisingAnalyzer):
     """
     Merchandising analysis stratified by month ranges and time slots.
+
+    Extra stratum dimensions (store, weekday, card cluster, ...) can be
+    registered with add_stratum(); they are counted in the same single
+    pass as the month ranges and time slots.
     """
 
-    def __init__(self, df: pd.DataFrame, figures_dir: Path):
-        super().__init__(df, figures_dir)
+    VALID_SLOTS = VALID_SLOTS
+
+    def __init__(self, df: pd.DataFrame, figures_dir: Path,
+                 renderer: Optional[FigureRenderer] = None):
+        super().__init__(df, figures_dir, renderer)
         self._prepare_datetime()
+        self.extra_strata: Dict[str, Union[str, pd.Series]] = {}
+
+    def add_stratum(self, name: str, values: Union[str, pd.Series]) -> None:
+        # values: a column of the dataframe or a Series aligned with it
+        self.extra_strata[name] = values
+        self._freq = None
+
+    def _strata(self) -> Dict[str, Union[str, pd.Series]]:
+        if "month_range" not in self.df.columns:
+            self._add_month_range()
+        if "time_slot" not in self.df.columns:
+            self._add_time_slot()
+
+        strata: Dict[str, Union[str, pd.Series]] = {}
+        for col in ("month_range", "time_slot"):
+            if col in self.df.columns:
+                strata[col] = col
+        strata.update(self.extra_strata)
+        return strata
 
     def _prepare_datetime(self) -> None:
-        # Build a datetime column from date + time
+        # The derived columns are normally built once by DataLoader;
+        # only rebuild them for frames that did not go through it
+        derived = (DATETIME_COL, MINUTE_COL, MONTH_COL, DAY_COL)
+        if all(c in self.df.columns for c in derived):
+            return
         if DATE_COL not in self.df.columns or TIME_COL not in self.df.columns:
             return
 
-        # Build datetime combining date and time
-        dt = pd.to_datetime(
-            self.df[DATE_COL].dt.strftime("%Y-%m-%d") + " " +
-            self.df[TIME_COL].astype(str),
-            errors="coerce"
-        )
-        self.df["datetime"] = dt
+        # Work on a shallow copy: the caller's columns are never replaced
+        df = self.df.copy(deep=False)
+        if not pd.api.types.is_datetime64_any_dtype(df[DATE_COL]):
+            df[DATE_COL] = pd.to_datetime(df[DATE_COL], errors="coerce")
+        if not pd.api.types.is_timedelta64_dtype(df[TIME_COL]):
+            # e.g. datetime.time objects or "HH:MM[:SS]" strings;
+            # to_timedelta needs the seconds, so "HH:MM" is padded
+            text = df[TIME_COL].astype(str).str.strip()
+            text = text.where(text.str.count(":") != 1, text + ":00")
+            df[TIME_COL] = pd.to_timedelta(text, errors="coerce")
+        # Unparseable dates/times are dropped, as in DataLoader
+        df = df.dropna(subset=[DATE_COL, TIME_COL])
+        self.df = DataLoader.add_datetime_columns(df)
 
     def _add_month_range(self) -> None:
         # Add R1/R2/R3 month ranges
-        if DATE_COL not in self.df.columns:
+        if MONTH_COL not in self.df.columns or DAY_COL not in self.df.columns:
             return
 
-        month = self.df[DATE_COL].dt.month
-        day = self.df[DATE_COL].dt.day
-
-        cond1 = (month < 5) | ((month == 5) & (day <= 15))
-        cond2 = ((month == 5) & (day > 15)) | ((month > 5) & (month <= 9))
-        cond3 = month >= 10
-
-        self.df["month_range"] = pd.Series(index=self.df.index, dtype="string")
-        self.df.loc[cond1, "month_range"] = "R1_Jan_midMay"
-        self.df.loc[cond2, "month_range"] = "R2_midMay_Sep"
-        self.df.loc[cond3, "month_range"] = "R3_Oct_Dec"
+        self.df["month_range"] = month_range(self.df[MONTH_COL], self.df[DAY_COL])
 
     def _add_time_slot(self) -> None:
         # Add time slots based on minutes of day
-        if "datetime" not in self.df.columns:
+        if MINUTE_COL not in self.df.columns:
             return
 
-        dt = self.df["datetime"]
-        hour_min = dt.dt.hour * 60 + dt.dt.minute
+        self.df["time_slot"] = time_slot(self.df[MINUTE_COL])
 
-        bins = [0, 8 * 60 + 30, 12 * 60 + 30, 16 * 60 + 30, 20 * 60 + 30, 24 * 60]
-        labels = ["before_8_30", "S1_08_30_12_30", "S2_12_30_16_30",
-                  "S3_16_30_20_30", "after_20_30"]
+    def _run_dimension(self, dimension: str, strata=None) -> None:
+        # Plot every (stratum, level) of one dimension from the frequency table
+        freq = self.frequencies()
+        freq = freq[freq["dimension"] == dimension]
+        if strata is None:
+            strata = freq["stratum"].unique()
 
-        self.df["time_slot"] = pd.cut(hour_min, bins=bins, labels=labels,
-                                      right=False, include_lowest=True)
+        for stratum in strata:
+            for level in MERCH_LEVELS:
+                if level in self.df.columns:
+                    counts = FrequencyEngine.counts_for(freq, dimension, stratum, level)
+                    self._plot_counts(counts, level, suffix=f"_{stratum}")
+        self.renderer.flush()
 
     def run_month_ranges(self) -> None:
         # Run analysis for each month range
@@ -65,11 +104,7 @@ class StratifiedAnalyzer(MerchandisingAnalyzer):
         if "month_range" not in self.df.columns:
             return
 
-        for r in self.df["month_range"].dropna().unique():
-            sub = self.df[self.df["month_range"] == r]
-            for level in MERCH_LEVELS:
-                if level in sub.columns:
-                    self._plot_top_bottom(sub[level], level, suffix=f"_{r}")
+        self._run_dimension("month_range")
 
     def run_time_slots(self) -> None:
         # Run analysis for S1/S2/S3 only
@@ -77,9 +112,10 @@ class StratifiedAnalyzer(MerchandisingAnalyzer):
         if "time_slot" not in self.df.columns:
             return
 
-        valid_slots = ["S1_08_30_12_30", "S2_12_30_16_30", "S3_16_30_20_30"]
-        for s in valid_slots:
-            sub = self.df[self.df["time_slot"] == s]
-            for level in MERCH_LEVELS:
-                if level in sub.columns:
-                    self._plot_top_bottom(sub[level], level, suffix=f"_{s}")
+        self._run_dimension("time_slot", strata=self.VALID_SLOTS)
+
+    def run_stratum(self, name: str) -> None:
+        # Run analysis for a stratum dimension registered with add_stratum()
+        if name not in self.extra_strata:
+            raise ValueError(f"Unknown stratum dimension: {name}")
+        self._run_dimension(name)
@@ -0,0 +1,204 @@
+import math
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+
+import numpy as np # type: ignore
+import pandas as pd # type: ignore
+
+from bitset_miner import count_itemsets
+
+Itemset = FrozenSet
+
+
+def sample_size_for(epsilon: float, delta: float) -> int:
+    """
+    Receipts needed so that the sample support of an itemset is below
+    its true support by more than epsilon with probability at most
+    delta (one-sided Hoeffding bound: n >= ln(1/delta) / (2 epsilon^2)).
+    Sampling without replacement only tightens the bound.
+    """
+    if not 0 < epsilon < 1 or not 0 < delta < 1:
+        raise ValueError("epsilon and delta must be in (0, 1)")
+    return math.ceil(math.log(1.0 / delta) / (2.0 * epsilon ** 2))
+
+
+def epsilon_for(sample_size: int, delta: float) -> float:
+    # Inverse of sample_size_for: the error bound of a given sample size
+    return math.sqrt(math.log(1.0 / delta) / (2.0 * sample_size))
+
+
+def negative_border(frequent: Set[Itemset], items: Iterable) -> Set[Itemset]:
+    """
+    Minimal infrequent itemsets: every item that is not frequent, plus
+    every itemset that is not frequent although all its subsets are.
+    """
+    items = list(items)
+    border = {frozenset([i]) for i in items} - frequent
+    frequent_items = [i for i in items if frozenset([i]) in frequent]
+
+    for itemset in frequent:
+        for item in frequent_items:
+            if item in itemset:
+                continue
+            cand = itemset | {item}
+            if cand in frequent or cand in border:
+                continue
+            if all((cand - {i}) in frequent for i in cand):
+                border.add(cand)
+    return border
+
+
+class ReceiptReservoir:
+    """
+    Uniform sample of `size` receipts from a stream of transaction
+    chunks (e.g. DataLoader.iter_chunks), in a single pass.
+
+    Every receipt gets a pseudo-random key by hashing its id with the
+    seed, and the sample is the set of receipts with the `size` smallest
+    keys (bottom-k sampling). This is a reservoir sample that keeps
+    whole receipts even when their lines are split across chunks, and
+    memory is bounded by the lines of the sampled receipts.
+    """
+
+    def __init__(self, size: int, id_col: str = "scontrino_id", seed: int = 42):
+        self.size = size
+        self.id_col = id_col
+        self.hash_key = f"{seed:016d}"[-16:]
+        self.n_lines = 0
+        self._lines: Optional[pd.DataFrame] = None
+        self._keys = np.empty(0, dtype=np.uint64)
+        self._threshold: Optional[np.uint64] = None  # key of the size-th receipt
+
+    def _hash(self, ids: pd.Series) -> np.ndarray:
+        return pd.util.hash_array(ids.to_numpy(), hash_key=self.hash_key, categorize=False)
+
+    def add(self, chunk: pd.DataFrame) -> None:
+        chunk = chunk[chunk[self.id_col].notna()]
+        self.n_lines += len(chunk)
+        keys = self._hash(chunk[self.id_col])
+        if self._threshold is not None:
+            # Once full, most lines are rejected without any copy
+            mask = keys <= self._threshold
+            chunk, keys = chunk[mask], keys[mask]
+        if len(chunk) == 0:
+            return
+
+        lines = chunk if self._lines is None else pd.concat([self._lines, chunk])
+        keys = np.concatenate([self._keys, keys])
+        distinct = np.unique(keys)
+        if len(distinct) > self.size:
+            self._threshold = distinct[self.size - 1]
+            mask = keys <= self._threshold
+            lines, keys = lines[mask], keys[mask]
+        self._lines, self._keys = lines, keys
+
+    @property
+    def complete(self) -> bool:
+        # True while no receipt has been rejected: the sample is all data
+        return self._threshold is None
+
+    def sample(self) -> pd.DataFrame:
+        # Lines of the sampled receipts
+        if self._lines is None:
+            return pd.DataFrame()
+        return self._lines
+
+    @classmethod
+    def from_frame(
+        cls,
+        df: pd.DataFrame,
+        size: int,
+        id_col: str = "scontrino_id",
+        seed: int = 42,
+        chunksize: int = 500_000,
+    ) -> pd.DataFrame:
+        # Sample of an in-memory frame, streamed in row chunks
+        reservoir = cls(size, id_col=id_col, seed=seed)
+        for start in range(0, len(df), chunksize):
+            reservoir.add(df.iloc[start:start + chunksize])
+        return reservoir.sample()
+
+
+class ItemsetCounter:
+    """
+    Exact receipt counts of arbitrary itemsets on all receipts, for the
+    verification pass of sampled mining.
+
+    One encoding pass keeps the distinct (receipt, item) pairs grouped
+    by item; the packed tidset of an item is only built when an itemset
+    containing it is counted, and counts are memoized, so verifying the
+    same candidates for several algorithms counts them once.
+    """
+
+    def __init__(self, receipt_ids: pd.Series, items: pd.Series):
+        valid = receipt_ids.notna().to_numpy() & items.notna().to_numpy()
+        receipt_codes, receipts = pd.factorize(receipt_ids[valid])
+        item_codes, labels = pd.factorize(items[valid])
+        n_items = len(labels)
+
+        # Distinct pairs keyed item-major, so each item's receipts are a
+        # contiguous run
+        keys = np.unique(item_codes.astype(np.int64) * len(receipts) + receipt_codes)
+        self.n_transactions = len(receipts)
+        self._rows = keys % len(receipts)
+        counts = np.bincount(keys // len(receipts), minlength=n_items)
+        self._offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.item_counts: Dict = dict(zip(labels, counts.tolist()))
+        self._position = {label: i for i, label in enumerate(labels)}
+        self._bits: Dict[int, np.ndarray] = {}
+        self._counts: Dict[Itemset, int] = {}
+
+    def _tidset(self, i: int) -> np.ndarray:
+        if i not in self._bits:
+            rows = self._rows[self._offsets[i]:self._offsets[i + 1]]
+            bits = np.zeros((self.n_transactions + 7) // 8, dtype=np.uint8)
+            np.bitwise_or.at(bits, rows >> 3, np.uint8(0x80) >> (rows & 7).astype(np.uint8))
+            self._bits[i] = bits
+        return self._bits[i]
+
+    def frequent_items(self, min_count: int) -> Set:
+        return {item for item, c in self.item_counts.items() if c >= min_count}
+
+    def counts(self, itemsets: Iterable[Itemset]) -> Dict[Itemset, int]:
+        itemsets = list(itemsets)
+        todo: List[Itemset] = []
+        for s in itemsets:
+            if s in self._counts:
+                continue
+            if any(i not in self._position for i in s):
+                self._counts[s] = 0  # an item that never occurs
+            elif len(s) == 1:
+                self._counts[s] = self.item_counts[next(iter(s))]
+            else:
+                todo.append(s)
+        if todo:
+            needed = sorted({self._position[i] for s in todo for i in s})
+            local = {pos: j for j, pos in enumerate(needed)}
+            bits = np.stack([self._tidset(pos) for pos in needed])
+            counts = count_itemsets(bits, [tuple(local[self._position[i]] for i in s)
+                                           for s in todo])
+            self._counts.update(zip(todo, counts.tolist()))
+        return {s: self._counts[s] for s in itemsets}
+
+
+@dataclass
+class SamplingReport:
+    """
+    Outcome of a sampled mining run (AssociationRuleMiner.run_sampled).
+    exact is False only when some itemset of the negative border turned
+    out to be frequent on the full data and no fallback was allowed: the
+    result then has the right supports but may miss itemsets. sampled is
+    False when the sample would have held every receipt: the data was
+    then mined exactly (epsilon 0).
+    """
+    n_transactions: int
+    sample_size: int
+    epsilon: float
+    delta: float
+    lowered_support: float
+    n_candidates: int = 0
+    n_border: int = 0
+    border_frequent: int = 0
+    exact: bool = True
+    fallback: bool = False
+    sampled: bool = True
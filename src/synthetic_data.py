@@ -0,0 +1,170 @@
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np # type: ignore
+import pandas as pd # type: ignore
+
+from config import ( # type: ignore
+    DATE_COL, TIME_COL, RECEIPT_COL, CARD_COL, PRODUCT_COL, DESCR_PROD_COL,
+    MERCH_LEVELS,
+)
+
+GENERATOR_VERSION = 1  # bump when the generated data changes
+
+QUANTITY_COL = "r_qta_pezzi"
+COLUMNS = [DATE_COL, TIME_COL, RECEIPT_COL, CARD_COL, PRODUCT_COL, DESCR_PROD_COL,
+           *MERCH_LEVELS, QUANTITY_COL]
+
+# Share of receipts per hour of day (opening hours 8:00 - 21:00, peaks
+# before lunch and after work)
+HOURLY_TRAFFIC = {8: 3, 9: 6, 10: 9, 11: 11, 12: 10, 13: 6, 14: 4, 15: 5,
+                  16: 7, 17: 11, 18: 13, 19: 10, 20: 5}
+
+
+class FidelityDataGenerator:
+    """
+    Synthetic supermarket fidelity data in the layout of the real
+    AnonymizedFidelity.csv (one row per receipt line).
+
+    - Products have Zipfian popularity (exponent zipf_s) and sit in a
+      liv1 -> liv2 -> liv3 -> liv4 taxonomy whose codes extend the
+      parent code (liv2 = liv1 * 100 + j, liv3 = liv2 * 100 + k,
+      liv4 = liv3 * 10 + m), as in the real data.
+    - Receipt sizes are 1 + Poisson(mean_items - 1), capped at max_items,
+      before repeated products are dropped (a product appears at most
+      once per receipt, with 1-3 pieces).
+    - Cards have Zipfian visit frequency; card_share of the receipts
+      carry a card, the others have no tessera (NaN).
+    - Every card belongs to one of n_segments shopper segments that
+      favour some liv1 departments, so the data has both co-purchase
+      structure (rules with lift > 1) and customer clusters.
+
+    The output is deterministic for a given seed (and chunk_size).
+    """
+
+    def __init__(
+        self,
+        n_products: int = 800,
+        n_cards: int = 1250,
+        card_share: float = 0.9,
+        zipf_s: float = 1.1,
+        mean_items: float = 10.0,
+        max_items: int = 40,
+        n_segments: int = 5,
+        year: int = 2024,
+        seed: int = 42,
+    ):
+        self.n_products = n_products
+        self.n_cards = n_cards
+        self.card_share = card_share
+        self.mean_items = mean_items
+        self.max_items = max_items
+        self.year = year
+        self.seed = seed
+
+        rng = np.random.default_rng(seed)
+        self.catalogue = self._build_catalogue(rng, n_products)
+
+        # Product probabilities per segment: Zipf popularity times the
+        # segment's affinity for the product's department
+        popularity = 1.0 / np.arange(1, n_products + 1) ** zipf_s
+        departments = self.catalogue["liv1"].to_numpy()
+        dept_codes = np.unique(departments)
+        affinity = rng.gamma(shape=0.7, scale=1.0, size=(n_segments, len(dept_codes))) + 0.1
+        weights = popularity[None, :] * affinity[:, np.searchsorted(dept_codes, departments)]
+        self.segment_probs = weights / weights.sum(axis=1, keepdims=True)
+
+        self.card_segment = rng.integers(0, n_segments, size=n_cards)
+        visits = 1.0 / np.arange(1, n_cards + 1) ** 0.8
+        self.card_probs = visits / visits.sum()
+
+        hours = np.array(list(HOURLY_TRAFFIC))
+        traffic = np.array(list(HOURLY_TRAFFIC.values()), dtype=np.float64)
+        self._hours, self._hour_probs = hours, traffic / traffic.sum()
+
+    @staticmethod
+    def _build_catalogue(rng: np.random.Generator, n_products: int) -> pd.DataFrame:
+        # liv4 leaves of a random 4-level taxonomy, then products on leaves
+        leaves = []
+        for liv1 in range(10, 14):
+            for j in range(1, rng.integers(1, 4) + 1):
+                liv2 = liv1 * 100 + j
+                for k in range(1, rng.integers(3, 9) + 1):
+                    liv3 = liv2 * 100 + k
+                    for m in range(1, rng.integers(2, 7) + 1):
+                        leaves.append((liv1, liv2, liv3, liv3 * 10 + m))
+        leaves = np.array(leaves)
+        # Every leaf gets at least one product when there are enough
+        leaf = np.concatenate([rng.permutation(len(leaves)),
+                               rng.integers(0, len(leaves), max(0, n_products - len(leaves)))])
+        leaf = rng.permutation(leaf[:n_products])
+
+        catalogue = pd.DataFrame(leaves[leaf], columns=MERCH_LEVELS)
+        catalogue.insert(0, PRODUCT_COL, 50000 + np.arange(n_products))
+        catalogue.insert(1, DESCR_PROD_COL, [f"PROD {i}" for i in range(n_products)])
+        return catalogue
+
+    def _receipts(self, rng: np.random.Generator, first_id: int, n: int) -> pd.DataFrame:
+        # One row per receipt: id, card, segment, date, time, size
+        has_card = rng.random(n) < self.card_share
+        cards = rng.choice(self.n_cards, size=n, p=self.card_probs)
+        segments = np.where(has_card, self.card_segment[cards],
+                            rng.integers(0, self.segment_probs.shape[0], size=n))
+
+        start = np.datetime64(f"{self.year}-01-01")
+        n_days = int((np.datetime64(f"{self.year + 1}-01-01") - start).astype(int))
+        dates = start + rng.integers(0, n_days, size=n).astype("timedelta64[D]")
+        hours = rng.choice(self._hours, size=n, p=self._hour_probs)
+        minutes = rng.integers(0, 60, size=n)
+
+        sizes = np.minimum(1 + rng.poisson(self.mean_items - 1, size=n), self.max_items)
+        return pd.DataFrame({
+            RECEIPT_COL: first_id + np.arange(n),
+            CARD_COL: np.where(has_card, cards + 1, np.nan),
+            "segment": segments,
+            DATE_COL: pd.to_datetime(dates).strftime("%Y-%m-%d"),
+            TIME_COL: [f"{h:02d}:{m:02d}" for h, m in zip(hours, minutes)],
+            "size": sizes,
+        })
+
+    def _lines(self, rng: np.random.Generator, receipts: pd.DataFrame) -> pd.DataFrame:
+        # Draw the products of every receipt from its segment distribution
+        receipt_pos = np.repeat(np.arange(len(receipts)), receipts["size"].to_numpy())
+        segments = receipts["segment"].to_numpy()[receipt_pos]
+        products = np.empty(len(receipt_pos), dtype=np.int64)
+        for segment in np.unique(segments):
+            mask = segments == segment
+            products[mask] = rng.choice(self.n_products, size=int(mask.sum()),
+                                        p=self.segment_probs[segment])
+
+        lines = pd.DataFrame({"pos": receipt_pos, "product": products})
+        lines = lines.drop_duplicates()
+        quantity = rng.integers(1, 4, size=len(lines))
+
+        head = receipts.iloc[lines["pos"].to_numpy()].reset_index(drop=True)
+        items = self.catalogue.iloc[lines["product"].to_numpy()].reset_index(drop=True)
+        out = pd.concat([head, items], axis=1)
+        out[QUANTITY_COL] = quantity
+        return out[COLUMNS]
+
+    def iter_chunks(self, n_receipts: int, chunk_size: int = 100_000) -> Iterator[pd.DataFrame]:
+        # Receipts in blocks of chunk_size, each with its own seeded stream
+        for block, first in enumerate(range(0, n_receipts, chunk_size)):
+            rng = np.random.default_rng([self.seed, block])
+            n = min(chunk_size, n_receipts - first)
+            yield self._lines(rng, self._receipts(rng, 100 + first, n))
+
+    def generate(self, n_receipts: int) -> pd.DataFrame:
+        return pd.concat(self.iter_chunks(n_receipts), ignore_index=True)
+
+    def write_csv(self, path: Path, n_receipts: int, chunk_size: int = 100_000) -> Path:
+        """
+        Write n_receipts receipts to a CSV shaped like the real dataset,
+        one chunk at a time (memory does not grow with n_receipts).
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        for i, chunk in enumerate(self.iter_chunks(n_receipts, chunk_size)):
+            chunk.to_csv(tmp, mode="w" if i == 0 else "a", header=i == 0, index=False)
+        tmp.replace(path)
+        return path